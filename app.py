@@ -1,9 +1,9 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, url_for
 from config import BaseConfig, config
+from tools import employee_store, spreadsheet_reader
+from tools.jobs import JobStore
 import logging
 import os
-import pandas as pd
-import numpy as np
 
 def create_app(config_class=None):
     """
@@ -11,63 +11,13 @@ def create_app(config_class=None):
     """
     app = Flask(__name__)
 
-    # --- Data Loading and Preparation (module-level-like loader) ---
-    # Attempt to load the Parquet data from project `data/uploads/employee_data.parquet`.
-    # This mirrors the standalone `app code.py` behaviour so the UI at root can call
-    # `/search_employee` and `/filter_by_dob_summary`.
-    global df
-    global date_columns
-    date_columns = ['DOJ', 'Last Working Date', 'DOB']
-    try:
-        base_dir = os.path.dirname(__file__)
-        data_path = os.path.normpath(os.path.join(base_dir, 'data', 'uploads', 'employee_data.parquet'))
-        # Try parquet first, then CSV, then Excel
-        csv_path = os.path.normpath(os.path.join(base_dir, 'data', 'uploads', 'employee_data.csv'))
-        excel_path = os.path.normpath(os.path.join(base_dir, 'data', 'uploads', 'employee_data.xlsx'))
-        if os.path.exists(data_path):
-            df = pd.read_parquet(data_path)
-        elif os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
-        elif os.path.exists(excel_path):
-            try:
-                df = pd.read_excel(excel_path, engine='openpyxl')
-            except Exception:
-                df = pd.DataFrame()
-        else:
-            df = pd.DataFrame()
-        if df is not None and not df.empty:
-            # normalize column names
-            df.columns = df.columns.astype(str).str.strip()
-
-            # detect Employee ID column under various names
-            emp_col = None
-            for c in df.columns:
-                lc = c.lower()
-                if 'employee' in lc and 'id' in lc:
-                    emp_col = c
-                    break
-            if emp_col is None and 'Employee ID' in df.columns:
-                emp_col = 'Employee ID'
-
-            if emp_col is not None:
-                # normalize Employee ID values to strings and ensure leading zero when appropriate
-                df[emp_col] = df[emp_col].astype(str).str.strip().replace('nan', '')
-                df[emp_col] = df[emp_col].apply(lambda x: ('0' + x) if (x and not str(x).startswith('0')) else x)
-                # rename to standard column name and set index
-                if emp_col != 'Employee ID':
-                    df = df.rename(columns={emp_col: 'Employee ID'})
-                df.set_index('Employee ID', inplace=True)
-
-            if 'FFS' in df.columns:
-                df['FFS'] = pd.to_numeric(df['FFS'], errors='coerce')
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-            df = df.fillna('Not Available')
-        else:
-            df = pd.DataFrame()
-    except Exception:
-        df = pd.DataFrame()
+    # --- Shared employee dataset ---
+    # Both `/search_employee` and the Exit Verifier blueprint read the same
+    # memory-mapped Arrow snapshot of `data/uploads/employee_data.*`. Mapping it
+    # here makes the first request fast and rebuilds the snapshot if the upload
+    # changed while the app was down.
+    data_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), 'data', 'uploads'))
+    employee_store.get_dataset(data_dir)
 
     # Determine which config to use
     if config_class is None:
@@ -76,6 +26,10 @@ def create_app(config_class=None):
 
     app.config.from_object(config_class)
 
+    # Employee uploads are ingested by a local worker pool; job state lives on disk
+    ingest_jobs = JobStore(os.path.join(os.path.dirname(__file__), 'data', 'jobs'),
+                           max_workers=app.config.get('JOB_WORKERS', 2))
+
     # Configure logging
     if not app.debug and not app.testing:
         if not os.path.exists('logs'):
@@ -143,8 +97,18 @@ def create_app(config_class=None):
         id_processor_bp.add_url_rule('/', endpoint='index', view_func=index_wrapper)
         id_processor_bp.add_url_rule('/process-file', endpoint='process_file_route', view_func=process_file_wrapper, methods=['POST'])
         id_processor_bp.add_url_rule('/download/<path:filename>', endpoint='download_file', view_func=download_wrapper)
+        # Background job API: upload returns a job ID, progress streams over SSE
+        id_processor_bp.add_url_rule('/jobs', endpoint='create_job', view_func=integrated_module.create_job, methods=['POST'])
+        id_processor_bp.add_url_rule('/jobs/<job_id>', endpoint='job_status', view_func=integrated_module.job_status)
+        id_processor_bp.add_url_rule('/jobs/<job_id>/events', endpoint='job_events', view_func=integrated_module.job_events)
 
         app.register_blueprint(id_processor_bp, url_prefix='/id-processor')
+
+        # Load the face detection model now (once per worker) instead of on the first upload
+        try:
+            integrated_module.warm_up()
+        except Exception:
+            app.logger.exception('Face detector warm-up failed')
     else:
         app.register_blueprint(id_processor_bp, url_prefix='/id-processor')
     app.register_blueprint(pdf_toolkit_bp, url_prefix='/pdf-toolkit')
@@ -200,19 +164,6 @@ def create_app(config_class=None):
         from flask import render_template
         return render_template('index.html', tools=tools)
 
-    def format_dates_in_response(records):
-        """Helper to format date columns to DD-MMM-YYYY for responses."""
-        for record in records:
-            for col in date_columns:
-                if col in record and (isinstance(record[col], (pd.Timestamp,)) or pd.notna(record[col])):
-                    try:
-                        dt = pd.to_datetime(record[col], errors='coerce')
-                        if pd.notna(dt):
-                            record[col] = dt.strftime('%d-%b-%Y')
-                    except Exception:
-                        pass
-        return records
-
     @app.route('/search_employee', methods=['GET'])
     def search_employee():
         """API for fetching FULL details of a single employee using a fast index lookup."""
@@ -220,36 +171,17 @@ def create_app(config_class=None):
         if not employee_id:
             return jsonify({'error': 'Employee ID is required.'}), 400
 
-        if df.empty:
+        dataset = employee_store.get_dataset(data_dir)
+        if dataset.empty:
             return jsonify({'message': 'Database not loaded.'}), 500
 
-        try:
-            # Try direct lookup; if not found, try with/without leading zero
-            emp = str(employee_id).strip()
-            candidates = [emp]
-            if not emp.startswith('0'):
-                candidates.append('0' + emp)
-            else:
-                # also try without leading zero
-                candidates.append(emp.lstrip('0'))
-
-            result_df = None
-            for c in candidates:
-                try:
-                    result_df = df.loc[[c]].reset_index()
-                    if not result_df.empty:
-                        break
-                except KeyError:
-                    result_df = pd.DataFrame()
-
-            if result_df is None or result_df.empty:
-                return jsonify({'message': 'Employee not found.'}), 404
-
-            records = result_df.to_dict('records')
-            formatted_records = format_dates_in_response(records)
-            return jsonify(formatted_records)
-        except KeyError:
-            return jsonify({'message': 'Employee not found.'}), 404
+        # One hash lookup covers the with/without leading zero, trimmed and
+        # case-folded forms; the record JSON was serialized at snapshot build.
+        pos = dataset.find(employee_id)
+        if pos is not None:
+            return app.response_class(f'[{dataset.record_json(pos)}]', mimetype='application/json')
+
+        return jsonify({'message': 'Employee not found.'}), 404
 
     @app.route("/health")
     def health():
@@ -258,46 +190,82 @@ def create_app(config_class=None):
 
     @app.route('/filter_by_dob_summary', methods=['GET'])
     def filter_by_dob_summary():
-        """API for fetching a compact SUMMARY of employees by DOB."""
-        dob_str = request.args.get('dob')
-        if not dob_str:
+        """API for fetching a compact SUMMARY of employees by DOB.
+
+        Accepts a single `dob` or a `dob_from`/`dob_to` range, with optional
+        `page`/`per_page`. The total match count is sent in `X-Total-Count`.
+        """
+        if not any(request.args.get(k) for k in ('dob', 'dob_from', 'dob_to')):
             return jsonify({'error': 'Date of Birth is required.'}), 400
 
-        if df.empty:
+        dataset = employee_store.get_dataset(data_dir)
+        if dataset.empty:
             return jsonify({'message': 'Database not loaded.'}), 500
 
         try:
-            search_date = pd.to_datetime(dob_str)
-            result_df = df[df['DOB'] == search_date]
-        except Exception:
-            return jsonify({'error': 'Invalid date format.'}), 400
+            start, end, offset, limit = employee_store.parse_dob_query(request.args)
+        except ValueError as e:
+            return jsonify({'error': f'{e}.'}), 400
 
-        if result_df.empty:
+        positions, total = dataset.dob_positions(start, end, offset, limit)
+        if not total:
             return jsonify({'message': 'No employees found with this DOB.'}), 404
 
-        # Convert the 'Employee ID' index back into a regular column
-        summary_df = result_df.reset_index()
         # Select compact columns for the frontend summary
-        cols = [c for c in ['Employee Name', 'Employee ID', 'Rehire', 'FFS'] if c in summary_df.columns]
-        summary_df = summary_df[cols]
-        records = summary_df.to_dict('records')
-        return jsonify(records)
+        response = jsonify(dataset.records(positions, employee_store.SUMMARY_COLUMNS))
+        response.headers['X-Total-Count'] = str(total)
+        return response
 
     from werkzeug.utils import secure_filename
 
+    def _ingest_upload(job, upload_path, ext):
+        """Job body: stream the spooled upload into the store, then drop it."""
+        try:
+            rows = employee_store.replace_dataset(
+                data_dir,
+                spreadsheet_reader.iter_chunks(upload_path, ext,
+                                               chunk_rows=app.config.get('INGEST_CHUNK_ROWS', 5000),
+                                               dtype={'Employee ID': str}),
+                progress=lambda n: job.progress(rows_parsed=n),
+            )
+        finally:
+            os.remove(upload_path)
+        target_path = os.path.join(data_dir, 'employee_data.parquet')
+        return {'rows': rows, 'message': f'File converted and saved to {target_path}'}
+
     @app.route('/configure', methods=['GET', 'POST'])
     def configure_data():
         """Simple configure page: upload an Excel/CSV to replace the current dataset.
-        Writes to `data/uploads/employee_data.parquet` and reloads `df` in-memory.
+        The upload is ingested by a background job that writes
+        `data/uploads/employee_data.parquet` and swaps in the rebuilt snapshot;
+        the POST returns the job ID straight away.
         """
         if request.method == 'GET':
             return '''
                 <html><body>
                 <h3>Upload Employee Data (Excel or CSV)</h3>
-                <form method="post" enctype="multipart/form-data">
+                <form id="configure-form" method="post" enctype="multipart/form-data">
                     <input type="file" name="file" accept=".csv,.xlsx,.xls" />
                     <input type="submit" value="Upload" />
                 </form>
+                <p id="configure-status"></p>
+                <script>
+                document.getElementById('configure-form').addEventListener('submit', async (e) => {
+                    e.preventDefault();
+                    const status = document.getElementById('configure-status');
+                    const resp = await fetch('/configure', { method: 'POST', body: new FormData(e.target) });
+                    const data = await resp.json();
+                    if (!resp.ok) { status.innerText = data.error; return; }
+                    const poll = async () => {
+                        const job = await (await fetch(data.status_url)).json();
+                        if (job.status === 'done') { status.innerText = job.result.message; return; }
+                        if (job.status === 'failed') { status.innerText = 'Conversion failed: ' + job.error; return; }
+                        status.innerText = `Processing... ${job.rows_parsed || 0} rows parsed`;
+                        setTimeout(poll, 1000);
+                    };
+                    poll();
+                });
+                </script>
                 </body></html>
             '''
 
@@ -308,42 +276,33 @@ def create_app(config_class=None):
         f = request.files['file']
         filename = secure_filename(f.filename)
         ext = os.path.splitext(filename)[1].lower()
+        if ext not in ['.xls', '.xlsx', '.csv']:
+            return jsonify({'error': 'Unsupported file type'}), 400
 
         try:
-            if ext in ['.xls', '.xlsx']:
-                df_new = pd.read_excel(f, engine='openpyxl')
-            elif ext == '.csv':
-                df_new = pd.read_csv(f)
-            else:
-                return jsonify({'error': 'Unsupported file type'}), 400
-
-            target_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), 'data', 'uploads'))
-            os.makedirs(target_dir, exist_ok=True)
-            target_path = os.path.join(target_dir, 'employee_data.parquet')
-
-            df_new.to_parquet(target_path, index=False)
-
-            # reload global df so API uses new data
-            try:
-                global df
-                df = pd.read_parquet(target_path)
-                if 'Employee ID' in df.columns:
-                    df.set_index('Employee ID', inplace=True)
-                df.columns = df.columns.astype(str).str.strip()
-                if 'FFS' in df.columns:
-                    df['FFS'] = pd.to_numeric(df['FFS'], errors='coerce')
-                for col in date_columns:
-                    if col in df.columns:
-                        df[col] = pd.to_datetime(df[col], errors='coerce')
-                df = df.fillna('Not Available')
-            except Exception:
-                pass
-
-            return jsonify({'success': True, 'message': f'File converted and saved to {target_path}'})
+            job_id = ingest_jobs.create('employee_upload', filename=filename, rows_parsed=0)
+            # Spool the upload to disk; the request stream is gone once we return
+            upload_path = os.path.join(ingest_jobs.directory, f'{job_id}{ext}')
+            f.save(upload_path)
+            ingest_jobs.submit(job_id, _ingest_upload, upload_path, ext)
         except Exception as e:
             app.logger.exception('Configure failed')
             return jsonify({'error': f'Conversion failed: {str(e)}'}), 500
 
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('configure_status', job_id=job_id)
+        }), 202
+
+    @app.route('/configure/status/<job_id>', methods=['GET'])
+    def configure_status(job_id):
+        """Report progress (rows parsed) of a background upload job."""
+        job = ingest_jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+
     # Error handlers
     @app.errorhandler(404)
     def not_found_error(error):
@@ -16,6 +16,10 @@ class BaseConfig:
     EXPORT_FOLDER = os.environ.get('EXPORT_FOLDER') or 'data/exports'
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
 
+    # Background job configuration (large uploads are ingested off the request thread)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    INGEST_CHUNK_ROWS = 5000
+
     # Security configuration
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
@@ -44,7 +48,8 @@ class BaseConfig:
         },
         'exit_verifier': {
             'cache_duration': 3600,  # 1 hour cache
-            'bulk_limit': 100
+            'bulk_limit': 100,
+            'compact_after_deltas': 8  # fold appended uploads into the base file
         },
         'exp_calculator': {
             'max_file_size': 10 * 1024 * 1024,  # 10MB
@@ -58,9 +63,25 @@ class BaseConfig:
             'id_patterns': [
                 'EMP####',
                 'USER####',
-                'STF####'
+                'STF####',
+                '010######',
+                '030######'
+            ],
+            'reserved_ids': ['EMP0000', 'USER0000', 'STF0000'],
+            'bulk_max_ids': 5000,  # largest batch accepted by /id-checker/bulk
+            # Roster analysis: location aliases (case-insensitive substrings) -> ID prefix.
+            # Rules are checked in order; the first rule with a matching alias wins.
+            'location_rules': [
+                {'group': 'bangalore_shillong', 'prefix': '010',
+                 'aliases': ['bangalore', 'blr', 'bengaluru', 'shillong']},
+                {'group': 'hyderabad', 'prefix': '030',
+                 'aliases': ['hyderabad', 'hyd']}
             ],
-            'reserved_ids': ['EMP0000', 'USER0000', 'STF0000']
+            # Repeat analyses of the same roster are served from cache
+            'analysis_cache_size': 32,  # in-memory LRU entries per worker
+            'analysis_cache_dir': 'data/cache/id_checker',  # shared disk tier; None disables
+            'analysis_cache_disk_entries': 512,  # disk tier keeps the most recently used files
+            'analysis_cache_max_age': 7 * 24 * 3600  # seconds before a disk entry expires
         }
     }
 
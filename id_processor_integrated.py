@@ -12,14 +12,27 @@ import io
 import time
 import traceback
 import fitz  # PyMuPDF
+from PIL import Image
 import base64
+import json
 import sys
 import tempfile
+import threading
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import atexit
 import shutil
-from flask import Flask, render_template, render_template_string, request, jsonify, send_file, after_this_request
+from contextlib import contextmanager
+import mimetypes
+from urllib.parse import quote
+from flask import Flask, Response, render_template, render_template_string, request, jsonify
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
+from tools.jobs import JobStore
+from tools.zipstream import ZipSink
+
 def get_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     try:
@@ -34,11 +47,39 @@ app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB limit
 app.config['SECRET_KEY'] = 'id-processor-secret-key'
 
 # Configuration
-MODEL_PATH = "face_detection_yunet_2023mar.onnx"  # Update with your actual model path
+MODEL_PATH = get_path("face_detection_yunet_2023mar.onnx")  # Update with your actual model path
+DETECTOR_SCORE_THRESHOLD = 0.6
+# Orientation search stops at the first angle whose best face scores at least this
+ORIENTATION_ACCEPT_SCORE = 0.85
+ORIENTATION_ANGLES = [0, -90, -270, -180]  # upright first, then sideways, upside-down last
+# Detection runs on a proxy with this longest side; the crop is taken from the full image
+DETECT_MAX_SIDE = 640
+# Large uploads are decoded at 1/2, 1/4 or 1/8 scale while the shorter side stays above this
+DECODE_MIN_SIDE = 1200
+REDUCED_DECODE_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                        (2, cv2.IMREAD_REDUCED_COLOR_2)]
+# ZIP members are filtered on their central-directory entry before anything is inflated
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+ZIP_MEMBER_MAX_BYTES = 25 * 1024 * 1024
+HEADER_PROBE_BYTES = 256 * 1024  # enough to reach the size header behind large EXIF blocks
+WARM_UP_SIZES = [(480, 640), (640, 480)]  # (w, h) of typical portrait/landscape uploads
+# Bulk uploads are processed on a pool of threads (OpenCV releases the GIL)
+IMAGE_WORKERS = int(os.environ.get('ID_IMAGE_WORKERS', os.cpu_count() or 1))
+# Detectors are shared by all threads of a worker. Warm-up loads one per thread that may
+# detect at once: the batch pool plus gunicorn's request threads (--threads 4 in the procfile)
+WARM_UP_DETECTORS = int(os.environ.get('ID_WARM_DETECTORS', IMAGE_WORKERS + 4))
+DETECTOR_POOL_SIZE = max(8, WARM_UP_DETECTORS * len(WARM_UP_SIZES))  # most kept loaded
 # Create a temporary directory for processed files
 TEMP_DIR = tempfile.mkdtemp()
 # Map temporary filenames -> user-visible download filename
 TEMP_NAME_MAP = {}
+# Background jobs: state, uploads and outputs shared by all workers on this host
+JOB_DIR = os.environ.get('ID_JOB_DIR') or os.path.join(tempfile.gettempdir(), 'id_processor_jobs')
+image_jobs = JobStore(JOB_DIR, max_workers=int(os.environ.get('ID_JOB_WORKERS', 2)))
+SSE_POLL_SECONDS = 0.25
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 300  # a stream is closed after this; EventSource reconnects on its own
+SSE_RETRY_MS = 1000
 
 # Register cleanup function to remove temporary directory on application exit
 @atexit.register
@@ -54,14 +95,195 @@ def create_temp_file(suffix=None):
     temp_file.close()
     return temp_file.name
 
+
+STREAM_CHUNK_SIZE = 64 * 1024
+WRITING_SUFFIX = '.writing'  # marker file present while an output archive is still growing
+STREAM_STALL_SECONDS = 120  # a growing archive with no new data for this long lost its writer
+
+
+def is_writing(path):
+    return os.path.exists(path + WRITING_SUFFIX)
+
+
+def stream_file(path, remove=True, poll_interval=0.05):
+    """Yield a file in chunks, following it while its writer is active; optionally delete it after.
+
+    Raises (aborting the response) if a growing file stops growing for
+    STREAM_STALL_SECONDS, e.g. because the worker writing it died.
+    """
+    try:
+        with open(path, 'rb') as f:
+            last_data = time.time()
+            while True:
+                finished = not is_writing(path)
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if chunk:
+                    last_data = time.time()
+                    yield chunk
+                elif finished:
+                    return
+                elif time.time() - last_data > STREAM_STALL_SECONDS:
+                    raise IOError(f'{os.path.basename(path)} stopped growing before it was finished')
+                else:
+                    time.sleep(poll_interval)
+    finally:
+        if remove:
+            try:
+                os.unlink(path)
+            except OSError as e:
+                print(f"Error removing temporary file: {e}")
+
+# Right-angle rotations are exact pixel transposes; no interpolation or clipped corners
+RIGHT_ANGLE_ROTATIONS = {
+    -90: cv2.ROTATE_90_CLOCKWISE,
+    -180: cv2.ROTATE_180,
+    -270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
 def rotate_image(image, angle):
     """Rotate image by specified angle"""
     if image is None:
         return None
+    if angle % 360 == 0:
+        return image
+    if angle in RIGHT_ANGLE_ROTATIONS:
+        return cv2.rotate(image, RIGHT_ANGLE_ROTATIONS[angle])
     center = tuple(np.array(image.shape[1::-1]) / 2)
     rot_mat = cv2.getRotationMatrix2D(center, angle, 1.0)
     return cv2.warpAffine(image, rot_mat, image.shape[1::-1], flags=cv2.INTER_LINEAR, borderValue=(255, 255, 255))
 
+def decode_image(img_bytes):
+    """Decode image bytes, letting the codec downscale sources far larger than the output.
+
+    The header is read with PIL (no pixel decode) to pick the largest
+    IMREAD_REDUCED_* factor that keeps enough resolution for a sharp crop.
+    """
+    buffer = np.frombuffer(img_bytes, np.uint8)
+    try:
+        with Image.open(io.BytesIO(img_bytes[:HEADER_PROBE_BYTES])) as header:
+            short_side = min(header.size)
+    except Exception:
+        short_side = 0
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if short_side // factor >= DECODE_MIN_SIDE:
+            image = cv2.imdecode(buffer, flag)
+            if image is not None:
+                return image
+            break
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def read_zip_member(input_zip, info):
+    """Inflate one member into a buffer sized from its central-directory entry.
+
+    Returns a memoryview; never reads more than the declared size.
+    """
+    buffer = bytearray(info.file_size)
+    view = memoryview(buffer)
+    filled = 0
+    with input_zip.open(info) as member:
+        while filled < info.file_size:
+            n = member.readinto(view[filled:])
+            if not n:
+                break
+            filled += n
+    return view[:filled]
+
+
+class DetectorPool:
+    """Process-wide pool of idle YuNet detectors, keyed by (model, input size).
+
+    A detector is not thread-safe, so each detection checks one out and
+    returns it afterwards; any thread (request threads as well as the batch
+    pool) gets an already loaded model. An idle detector of the right size is
+    preferred; once `max_detectors` are loaded the least recently used idle
+    one is re-sized instead of parsing the ONNX model again.
+    """
+
+    def __init__(self, max_detectors=DETECTOR_POOL_SIZE):
+        self.max_detectors = max_detectors
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._idle = OrderedDict()  # key -> [detector, ...], least recently used first
+        self._loaded = 0
+        self._pid = os.getpid()
+
+    def checkout(self, model_path, size):
+        key = (model_path, size)
+        with self._lock:
+            if self._pid != os.getpid():
+                # a forked worker must not share detectors created in its parent
+                self._reset()
+            if key in self._idle:
+                return self._pop(key)
+            if self._loaded >= self.max_detectors:
+                spare = next((k for k in self._idle if k[0] == model_path), None)
+                if spare is not None:
+                    detector = self._pop(spare)
+                    detector.setInputSize(size)
+                    return detector
+            self._loaded += 1
+        try:
+            return cv2.FaceDetectorYN_create(model_path, "", size, score_threshold=DETECTOR_SCORE_THRESHOLD)
+        except Exception:
+            with self._lock:
+                self._loaded -= 1
+            raise
+
+    def checkin(self, model_path, size, detector):
+        key = (model_path, size)
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if sum(map(len, self._idle.values())) >= self.max_detectors:
+                self._loaded -= 1  # over capacity (peak concurrency): let it go
+                return
+            self._idle.setdefault(key, []).append(detector)
+            self._idle.move_to_end(key)
+
+    @contextmanager
+    def acquire(self, model_path, size):
+        detector = self.checkout(model_path, size)
+        try:
+            yield detector
+        finally:
+            self.checkin(model_path, size, detector)
+
+    def _pop(self, key):
+        detectors = self._idle[key]
+        detector = detectors.pop()
+        if not detectors:
+            del self._idle[key]
+        return detector
+
+
+detector_pool = DetectorPool()
+
+
+def warm_up(model_path=MODEL_PATH, sizes=WARM_UP_SIZES, count=WARM_UP_DETECTORS):
+    """Load `count` detectors per common size into the shared pool so first requests are fast.
+
+    All of them are held until every one has run an inference, so the pool
+    ends up with distinct warm detectors instead of one re-used repeatedly.
+    """
+    if not os.path.exists(model_path):
+        return False
+    held = []
+    try:
+        for w, h in sizes:
+            for _ in range(count):
+                detector = detector_pool.checkout(model_path, (w, h))
+                held.append(((w, h), detector))
+                detector.detect(np.full((h, w, 3), 255, np.uint8))
+    finally:
+        for size, detector in held:
+            detector_pool.checkin(model_path, size, detector)
+    return True
+
+
 def process_image(cv_image, model_path):
     """Process image with face detection and cropping"""
     # Check if model file exists, fallback to basic processing if not
@@ -69,25 +291,40 @@ def process_image(cv_image, model_path):
         return cv2.resize(cv_image, (360, 480)), "Processed (fallback - no face detection model)"
 
     try:
-        detector = cv2.FaceDetectorYN_create(model_path, "", (0, 0), score_threshold=0.6)
         best_angle, best_face, max_score, final_rotated_image = 0, None, -1.0, None
 
-        for angle in [0, -90, -180, -270]:
-            rotated_test_image = rotate_image(cv_image, angle)
+        # Detect on a small proxy; the box is scaled back to the full image below
+        scale = min(1.0, DETECT_MAX_SIDE / max(cv_image.shape[:2]))
+        proxy = cv_image if scale >= 1.0 else cv2.resize(
+            cv_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        # cv2.imdecode has already applied any EXIF orientation, so most photos are upright
+        # and a confident first pass ends the search
+        for angle in ORIENTATION_ANGLES:
+            rotated_test_image = rotate_image(proxy, angle)
             if rotated_test_image is None:
                 continue
 
             h, w, _ = rotated_test_image.shape
-            detector.setInputSize((w, h))
-            _, faces = detector.detect(rotated_test_image)
+            with detector_pool.acquire(model_path, (w, h)) as detector:
+                _, faces = detector.detect(rotated_test_image)
 
             if faces is not None and len(faces) > 0 and faces[0][14] > max_score:
                 max_score, best_angle, best_face, final_rotated_image = faces[0][14], angle, faces[0], rotated_test_image
+            if max_score >= ORIENTATION_ACCEPT_SCORE:
+                break
 
         if best_face is None:
             return None, "No face detected"
 
-        (x, y, w, h) = list(map(int, best_face[:4]))
+        box = best_face[:4]
+        if proxy is not cv_image:
+            proxy_h, proxy_w = final_rotated_image.shape[:2]
+            final_rotated_image = rotate_image(cv_image, best_angle)
+            full_h, full_w = final_rotated_image.shape[:2]
+            box = box * np.array([full_w / proxy_w, full_h / proxy_h] * 2, dtype=np.float32)
+
+        (x, y, w, h) = list(map(int, box))
         final_w = int(w * 1.8)
         final_h = int(final_w * (4.0 / 3.0))
         center_x = x + w // 2
@@ -106,30 +343,146 @@ def process_image(cv_image, model_path):
         # Fallback to basic resize if face detection fails
         return cv2.resize(cv_image, (360, 480)), "Processed with fallback (face detection failed)"
 
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+
+def image_executor():
+    """Shared pool for the decode -> detect -> crop -> encode stages.
+
+    Created lazily so each forked worker gets its own threads; the threads
+    outlive a request, so their face detectors stay loaded.
+    """
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            _image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='id-image')
+        return _image_pool
+
+
+def process_upload(display_name, payload):
+    """Decode (if needed), crop and JPEG-encode one image; returns (jpeg_bytes or None, log line)."""
+    if isinstance(payload, np.ndarray):
+        cv_image = payload
+    else:
+        cv_image = decode_image(payload)
+    if cv_image is None:
+        return None, f"🟡 SKIPPING: Cannot decode '{display_name}'"
+
+    processed_image, msg = process_image(cv_image, MODEL_PATH)
+    if processed_image is None:
+        return None, f"❌ FAILED: '{display_name}': {msg}"
+    _, img_buffer = cv2.imencode('.jpg', processed_image)
+    return img_buffer.tobytes(), f"✅ SUCCESS: '{display_name}'"
+
+
+def _zip_writer(output_path, writes, errors):
+    # Single owner of the output archive; keeps draining after an error so producers never block
+    try:
+        with open(output_path, 'wb') as raw, \
+                zipfile.ZipFile(ZipSink(raw), 'w', zipfile.ZIP_DEFLATED, False) as output_zip:
+            while True:
+                item = writes.get()
+                if item is None:
+                    break
+                output_zip.writestr(*item)
+                raw.flush()  # readers tailing the file see whole entries
+    except Exception as e:
+        errors.append(e)
+        while writes.get() is not None:
+            pass
+    finally:
+        try:
+            os.unlink(output_path + WRITING_SUFFIX)
+        except OSError:
+            pass
+
+
+def process_batch(items, output_path, logs, on_log=None, on_start=None):
+    """Process `items` in parallel and write the JPEGs to a ZIP at `output_path`.
+
+    `items` yields (display_name, arcname, payload) where payload is encoded
+    image bytes, a decoded image, or a log line for an item skipped up front.
+    At most 2 * IMAGE_WORKERS images are in flight; log lines are appended in
+    input order, and `on_log(items_done)` is called after each one.
+    `on_start()` is called once the archive and its writing marker exist, the
+    earliest point its download URL can be handed out. Returns the number of
+    images written.
+    """
+    executor = image_executor()
+    in_flight = deque()
+    writes = queue.Queue(maxsize=IMAGE_WORKERS * 2)
+    errors = []
+    open(output_path + WRITING_SUFFIX, 'wb').close()
+    open(output_path, 'wb').close()
+    writer = threading.Thread(target=_zip_writer, args=(output_path, writes, errors), daemon=True)
+    writer.start()
+    success_count = 0
+    first_log = len(logs)
+
+    def finish_oldest():
+        display_name, arcname, future = in_flight.popleft()
+        try:
+            jpeg, line = future.result()
+        except Exception as e:
+            jpeg, line = None, f"❌ FAILED: '{display_name}': {str(e)}"
+        logs.append(line)
+        if on_log is not None:
+            on_log(len(logs) - first_log)
+        if jpeg is not None:
+            writes.put((arcname, jpeg))
+            return 1
+        return 0
+
+    try:
+        if on_start is not None:
+            on_start()
+        for display_name, arcname, payload in items:
+            if isinstance(payload, str):
+                future = Future()
+                future.set_result((None, payload))
+            else:
+                future = executor.submit(process_upload, display_name, payload)
+            in_flight.append((display_name, arcname, future))
+            if len(in_flight) >= IMAGE_WORKERS * 2:
+                success_count += finish_oldest()
+        while in_flight:
+            success_count += finish_oldest()
+    finally:
+        writes.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+    return success_count
+
+
 @app.route('/')
 def index():
     """Main page"""
     return render_template_string(open('id_processor_frontend.html', encoding='utf-8').read())
 
-@app.route('/process-file', methods=['POST'])
-def process_file_route():
-    """Process uploaded file"""
+def run_processing(files, output_name='', new_output=create_temp_file, progress=None):
+    """Process uploaded files (one image/PDF, several files, or one ZIP) and return the result dict.
+
+    `files` are FileStorage-like objects. Outputs are created with
+    `new_output(suffix)`. `progress(**fields)`, if given, receives the logs so
+    far plus `processed`/`total` counts and, as soon as the output archive
+    exists, its `download_url` so it can be fetched while it is written.
+    """
+    progress = progress or (lambda **fields: None)
     try:
-        files = request.files.getlist('file_input')
         if not files or len(files) == 0:
-            return jsonify({'status': 'error', 'logs': ["❌ ERROR: No file selected."]})
+            return {'status': 'error', 'logs': ["❌ ERROR: No file selected."]}
 
         # If multiple files were uploaded (non-zip), process them as a batch
         if len(files) > 1:
             logs = [f"🚀 Processing {len(files)} uploaded files..."]
-            success_count = 0
             PHOTO_LIMIT = 5
             if len(files) > PHOTO_LIMIT:
-                return jsonify({'status': 'error', 'logs': [f"❌ ERROR: You uploaded {len(files)} files; the limit is {PHOTO_LIMIT}."]})
+                return {'status': 'error', 'logs': [f"❌ ERROR: You uploaded {len(files)} files; the limit is {PHOTO_LIMIT}."]}
 
-            output_zip_stream = io.BytesIO()
             # Allow client to request a specific output zip name
-            requested_name = request.form.get('output_name', '').strip()
+            requested_name = (output_name or '').strip()
             if requested_name:
                 safe_output_name = secure_filename(requested_name)
                 if not safe_output_name.lower().endswith('.zip'):
@@ -137,59 +490,50 @@ def process_file_route():
             else:
                 safe_output_name = 'processed_files.zip'
 
-            for f in files:
-                original_filename = f.filename
-                base_name, extension = os.path.splitext(original_filename)
-                logs.append(f"⏳ Processing '{original_filename}'...")
-
-                # Read image bytes and convert
-                try:
-                    if extension.lower() == '.pdf':
-                        doc = fitz.open(stream=f.read(), filetype='pdf')
-                        if doc.page_count > 0:
-                            page = doc[0]
-                            pix = page.get_pixmap()
-                            img_array = np.frombuffer(pix.tobytes('ppm'), np.uint8)
-                            cv_image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+            def uploaded_images():
+                for f in files:
+                    original_filename = f.filename
+                    extension = os.path.splitext(original_filename)[1]
+                    arcname = f"{os.path.splitext(os.path.basename(original_filename))[0]}_processed.jpg"
+                    try:
+                        if extension.lower() == '.pdf':
+                            # PyMuPDF is not thread-safe: render on this thread, crop on the pool
+                            doc = fitz.open(stream=f.read(), filetype='pdf')
+                            if doc.page_count > 0:
+                                pix = doc[0].get_pixmap()
+                                img_array = np.frombuffer(pix.tobytes('ppm'), np.uint8)
+                                payload = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+                                if payload is None:
+                                    payload = f"🟡 SKIPPING: Cannot decode '{original_filename}'"
+                            else:
+                                payload = f"🟡 SKIPPING: PDF '{original_filename}' is empty."
                         else:
-                            logs[-1] = f"🟡 SKIPPING: PDF '{original_filename}' is empty."
-                            continue
-                    else:
-                        img_bytes = f.read()
-                        cv_image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
-
-                    if cv_image is None:
-                        logs[-1] = f"🟡 SKIPPING: Cannot decode '{original_filename}'"
-                        continue
-
-                    processed_image, msg = process_image(cv_image, MODEL_PATH)
-                    if processed_image is not None:
-                        _, img_buffer = cv2.imencode('.jpg', processed_image)
-                        base = os.path.splitext(os.path.basename(original_filename))[0]
-                        with zipfile.ZipFile(output_zip_stream, 'a', zipfile.ZIP_DEFLATED, False) as output_zip:
-                            output_zip.writestr(f"{base}_processed.jpg", img_buffer.tobytes())
-                        logs[-1] = f"✅ SUCCESS: '{original_filename}'"
-                        success_count += 1
-                    else:
-                        logs[-1] = f"❌ FAILED: '{original_filename}': {msg}"
-                except Exception as e:
-                    logs[-1] = f"❌ FAILED: '{original_filename}': {str(e)}"
+                            payload = f.read()
+                    except Exception as e:
+                        payload = f"❌ FAILED: '{original_filename}': {str(e)}"
+                    yield original_filename, arcname, payload
+
+            temp_path = new_output('.zip')
+            TEMP_NAME_MAP[os.path.basename(temp_path)] = safe_output_name
+            success_count = process_batch(
+                uploaded_images(), temp_path, logs,
+                on_log=lambda done: progress(logs=logs, processed=done, total=len(files)),
+                on_start=lambda: progress(logs=logs, processed=0, total=len(files),
+                                          download_url=f'/download/{os.path.basename(temp_path)}',
+                                          download_filename=safe_output_name))
 
             if success_count > 0:
-                temp_path = create_temp_file(suffix='.zip')
-                with open(temp_path, 'wb') as out_f:
-                    out_f.write(output_zip_stream.getvalue())
-
                 logs.append(f"🎉 DONE: Successfully processed {success_count} files. Click download to get the results ZIP.")
-                TEMP_NAME_MAP[os.path.basename(temp_path)] = safe_output_name
-                return jsonify({
+                return {
                     'status': 'success',
                     'logs': logs,
                     'download_url': f'/download/{os.path.basename(temp_path)}',
                     'download_filename': safe_output_name
-                })
+                }
             else:
-                return jsonify({'status': 'error', 'logs': logs + ["No images were successfully processed."]})
+                TEMP_NAME_MAP.pop(os.path.basename(temp_path), None)
+                os.unlink(temp_path)
+                return {'status': 'error', 'logs': logs + ["No images were successfully processed."]}
 
         # Single-file handling (fallthrough)
         file = files[0]
@@ -210,14 +554,15 @@ def process_file_route():
                     img_array = np.frombuffer(pix.tobytes("ppm"), np.uint8)
                     cv_image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
                 else:
-                    return jsonify({'status': 'error', 'logs': logs + ["❌ ERROR: PDF is empty."]})
+                    return {'status': 'error', 'logs': logs + ["❌ ERROR: PDF is empty."]}
             else:
-                cv_image = cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_COLOR)
+                cv_image = decode_image(file.read())
 
             if cv_image is None:
-                return jsonify({'status': 'error', 'logs': [f"❌ ERROR: Could not read file."]})
+                return {'status': 'error', 'logs': [f"❌ ERROR: Could not read file."]}
 
             logs.append(f"⏳ Processing '{original_filename}'...")
+            progress(logs=logs, processed=0, total=1)
             processed_image, msg = process_image(cv_image, MODEL_PATH)
 
             if processed_image is not None:
@@ -225,74 +570,57 @@ def process_file_route():
                 base64_image = base64.b64encode(buffer).decode('utf-8')
 
                 # Save to temporary file
-                temp_path = create_temp_file(suffix='.jpg')
-                cv2.imwrite(temp_path, processed_image)
+                temp_path = new_output('.jpg')
+                with open(temp_path, 'wb') as out_f:
+                    out_f.write(buffer.tobytes())
 
                 logs[-1] = f"✅ SUCCESS: {msg}"
                 display_name = f"{base_name}_processed.jpg"
                 TEMP_NAME_MAP[os.path.basename(temp_path)] = display_name
-                return jsonify({
+                return {
                     'status': 'success',
                     'logs': logs,
                     'image_data': base64_image,
                     'download_url': f'/download/{os.path.basename(temp_path)}',
                     'download_filename': display_name
-                })
+                }
             else:
                 logs[-1] = f"❌ FAILED: {msg}"
-                return jsonify({'status': 'error', 'logs': logs})
+                return {'status': 'error', 'logs': logs}
 
         # --- BULK ZIP Processing ---
         elif extension.lower() == '.zip':
             logs = [f"🚀 Unpacking '{original_filename}'..."]
-            success_count = 0
             PHOTO_LIMIT = 100
-            zip_stream = io.BytesIO(file.read())
-            output_zip_stream = io.BytesIO()
-
-            with zipfile.ZipFile(zip_stream, 'r') as input_zip:
-                file_list = [name for name in input_zip.namelist() if not name.startswith('__MACOSX/')]
+            # Werkzeug spools large uploads to a temp file; read the archive from it in place
+            with zipfile.ZipFile(file.stream, 'r') as input_zip:
+                file_list = [info for info in input_zip.infolist() if not info.filename.startswith('__MACOSX/')]
                 if len(file_list) > PHOTO_LIMIT:
-                    return jsonify({
+                    return {
                         'status': 'error',
                         'logs': [f"❌ ERROR: ZIP contains {len(file_list)} files, which is over the limit of {PHOTO_LIMIT}."]
-                    })
-
-                for filename_in_zip in file_list:
-                    if filename_in_zip.endswith('/'):
-                        continue
-
-                    logs.append(f"⏳ Processing '{os.path.basename(filename_in_zip)}'...")
-                    img_bytes = input_zip.read(filename_in_zip)
-                    if not img_bytes:
-                        logs[-1] = f"🟡 SKIPPING: '{os.path.basename(filename_in_zip)}' is empty."
-                        continue
-
-                    cv_image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
-                    if cv_image is None:
-                        logs[-1] = f"🟡 SKIPPING: Cannot decode '{os.path.basename(filename_in_zip)}'"
-                        continue
-
-                    processed_image, msg = process_image(cv_image, MODEL_PATH)
-                    if processed_image is not None:
-                        _, img_buffer = cv2.imencode('.jpg', processed_image)
-                        base, _ = os.path.splitext(os.path.basename(filename_in_zip))
-                        with zipfile.ZipFile(output_zip_stream, 'a', zipfile.ZIP_DEFLATED, False) as output_zip:
-                            output_zip.writestr(f"{base}_processed.jpg", img_buffer.tobytes())
-                        logs[-1] = f"✅ SUCCESS: '{os.path.basename(filename_in_zip)}'"
-                        success_count += 1
-                    else:
-                        logs[-1] = f"❌ FAILED: '{os.path.basename(filename_in_zip)}': {msg}"
+                    }
 
-            if success_count > 0:
-                # Save ZIP to temporary file
-                temp_path = create_temp_file(suffix='.zip')
-                with open(temp_path, 'wb') as f:
-                    f.write(output_zip_stream.getvalue())
+                def zip_images():
+                    for info in file_list:
+                        if info.is_dir():
+                            continue
+                        display_name = os.path.basename(info.filename)
+                        stem, member_ext = os.path.splitext(display_name)
+                        arcname = f"{stem}_processed.jpg"
+                        # decide from the central directory; skipped members are never inflated
+                        if member_ext.lower() not in IMAGE_EXTENSIONS:
+                            yield display_name, arcname, f"🟡 SKIPPING: '{display_name}' is not an image."
+                        elif info.file_size == 0:
+                            yield display_name, arcname, f"🟡 SKIPPING: '{display_name}' is empty."
+                        elif info.file_size > ZIP_MEMBER_MAX_BYTES:
+                            yield display_name, arcname, (f"🟡 SKIPPING: '{display_name}' is too large "
+                                                          f"({info.file_size / (1024 * 1024):.1f} MB).")
+                        else:
+                            yield display_name, arcname, read_zip_member(input_zip, info)
 
-                logs.append(f"🎉 DONE: Successfully processed {success_count} images. Click download to get the results ZIP.")
                 # Allow optional output name override from form
-                requested_name = request.form.get('output_name', '').strip()
+                requested_name = (output_name or '').strip()
                 if requested_name:
                     safe_name = secure_filename(requested_name)
                     if not safe_name.lower().endswith('.zip'):
@@ -301,55 +629,158 @@ def process_file_route():
                 else:
                     download_filename = f'processed_{base_name}.zip'
 
+                temp_path = new_output('.zip')
                 # Store desired download filename for this temp file
                 TEMP_NAME_MAP[os.path.basename(temp_path)] = download_filename
+                total = sum(1 for info in file_list if not info.is_dir())
+                success_count = process_batch(
+                    zip_images(), temp_path, logs,
+                    on_log=lambda done: progress(logs=logs, processed=done, total=total),
+                    on_start=lambda: progress(logs=logs, processed=0, total=total,
+                                              download_url=f'/download/{os.path.basename(temp_path)}',
+                                              download_filename=download_filename))
 
-                return jsonify({
+            if success_count > 0:
+                logs.append(f"🎉 DONE: Successfully processed {success_count} images. Click download to get the results ZIP.")
+                return {
                     'status': 'success',
                     'logs': logs,
                     'download_url': f'/download/{os.path.basename(temp_path)}',
                     'download_filename': download_filename
-                })
+                }
             else:
-                return jsonify({'status': 'error', 'logs': logs + ["No images were successfully processed."]})
+                TEMP_NAME_MAP.pop(os.path.basename(temp_path), None)
+                os.unlink(temp_path)
+                return {'status': 'error', 'logs': logs + ["No images were successfully processed."]}
         else:
-            return jsonify({'status': 'error', 'logs': [f"❌ ERROR: Unsupported file type '{extension}'."]})
+            return {'status': 'error', 'logs': [f"❌ ERROR: Unsupported file type '{extension}'."]}
 
     except Exception as e:
         error_details = traceback.format_exc()
         print(error_details)
-        return jsonify({'status': 'error', 'logs': [f"❌ An unexpected server error occurred: {str(e)}"]})
+        return {'status': 'error', 'logs': [f"❌ An unexpected server error occurred: {str(e)}"]}
+
+
+@app.route('/process-file', methods=['POST'])
+def process_file_route():
+    """Process uploaded file"""
+    return jsonify(run_processing(request.files.getlist('file_input'), request.form.get('output_name', '')))
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue uploaded files for background processing and return the job ID immediately.
+
+    Uploads are saved under the shared job directory so whichever worker runs
+    the job (and whichever serves status/download requests) can read them.
+    """
+    files = [f for f in request.files.getlist('file_input') if f and f.filename]
+    if not files:
+        return jsonify({'status': 'error', 'logs': ["❌ ERROR: No file selected."]}), 400
+
+    job_id = image_jobs.create('id_images', status_message='Queued', logs=[], processed=0, total=0)
+    upload_dir = os.path.join(JOB_DIR, 'uploads', job_id)
+    os.makedirs(upload_dir, exist_ok=True)
+    names = []
+    for i, f in enumerate(files):
+        f.save(os.path.join(upload_dir, str(i)))
+        names.append(f.filename)
+
+    image_jobs.submit(job_id, _run_processing_job, upload_dir, names, request.form.get('output_name', ''))
+    return jsonify({
+        'status': 'queued',
+        'job_id': job_id,
+        'status_url': f'/jobs/{job_id}',
+        'events_url': f'/jobs/{job_id}/events'
+    }), 202
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = image_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events stream of a job's progress, ending with a `done` or `failed` event.
+
+    A job whose worker died is reported as failed by the job store. Streams
+    are also closed after SSE_MAX_SECONDS so none holds a request thread
+    indefinitely; the browser reconnects and gets the current state.
+    """
+    if image_jobs.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def events():
+        last_update = None
+        started = last_heartbeat = time.time()
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        while time.time() - started < SSE_MAX_SECONDS:
+            job = image_jobs.get(job_id)
+            if job is None:
+                yield 'event: failed\ndata: {"error": "Job not found"}\n\n'
+                return
+            if job.get('status') in ('done', 'failed'):
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                return
+            if job.get('updated_at') != last_update:
+                last_update = job.get('updated_at')
+                yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+            elif time.time() - last_heartbeat > SSE_HEARTBEAT_SECONDS:
+                yield ': keep-alive\n\n'
+            else:
+                time.sleep(SSE_POLL_SECONDS)
+                continue
+            last_heartbeat = time.time()
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _run_processing_job(job, upload_dir, names, output_name):
+    uploads = [FileStorage(stream=open(os.path.join(upload_dir, str(i)), 'rb'), filename=name)
+               for i, name in enumerate(names)]
+    try:
+        return run_processing(uploads, output_name,
+                              new_output=lambda suffix: os.path.join(JOB_DIR, f'{job.id}{suffix}'),
+                              progress=job.progress)
+    finally:
+        for upload in uploads:
+            upload.close()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    """Serve processed files from temporary directory"""
-    temp_file_path = os.path.join(TEMP_DIR, filename)
-    
-    if not os.path.exists(temp_file_path):
-        return jsonify({'error': 'File not found'}), 404
-        
-    @after_this_request
-    def remove_file(response):
-        try:
-            # Delete the temporary file after sending
-            os.unlink(temp_file_path)
-        except Exception as e:
-            print(f"Error removing temporary file: {e}")
-        return response
+    """Stream a processed file from the temporary directory, then delete it.
 
-    # Determine display filename if available
+    An archive that is still being written is followed until its writer
+    finishes, so the download can start before processing does.
+    """
+    filename = os.path.basename(filename)
+    temp_file_path = os.path.join(TEMP_DIR, filename)
     display_name = TEMP_NAME_MAP.pop(filename, None)
-    try:
-        if display_name:
-            # Flask >=2.0 supports download_name
-            return send_file(temp_file_path, as_attachment=True, download_name=display_name)
-        else:
-            return send_file(temp_file_path, as_attachment=True)
-    except TypeError:
-        # Older Flask versions use 'attachment_filename'
-        if display_name:
-            return send_file(temp_file_path, as_attachment=True, attachment_filename=display_name)
-        return send_file(temp_file_path, as_attachment=True)
+
+    if not os.path.exists(temp_file_path):
+        # job outputs live in the shared job directory, named after the job
+        job = image_jobs.get(os.path.splitext(filename)[0])
+        temp_file_path = os.path.join(JOB_DIR, filename)
+        if job is None or not os.path.exists(temp_file_path):
+            return jsonify({'error': 'File not found'}), 404
+        display_name = display_name or job.get('download_filename') or (job.get('result') or {}).get('download_filename')
+
+    display_name = display_name or filename
+    headers = {
+        'Content-Disposition': f"attachment; filename=\"{secure_filename(display_name) or filename}\"; "
+                               f"filename*=UTF-8''{quote(display_name)}"
+    }
+    if not is_writing(temp_file_path):
+        headers['Content-Length'] = str(os.path.getsize(temp_file_path))
+    mimetype = mimetypes.guess_type(display_name)[0] or 'application/octet-stream'
+    return Response(stream_file(temp_file_path), mimetype=mimetype, headers=headers, direct_passthrough=True)
 
 if __name__ == '__main__':
     # Ensure temporary directory exists
@@ -0,0 +1,730 @@
+"""
+Employee Dataset Store
+
+Shared, read-only employee dataset used by the root search API and the
+Employee Exit Verifier blueprint.
+
+The uploaded parquet/CSV/Excel file is normalized once into an Arrow IPC
+snapshot (`employee_data.arrow`) next to it. Every gunicorn worker maps that
+snapshot read-only, so the column data lives in the OS page cache once no
+matter how many workers are running, and a restarted worker only re-maps the
+file instead of re-parsing the parquet.
+
+Appended uploads are written as small parquet delta files under
+`employee_data.deltas/`; workers load only the deltas they have not seen yet
+and patch their indexes in place. `compact` folds the deltas back into the
+base parquet and snapshot.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:  # Windows / PyInstaller builds run single-process
+    fcntl = None
+
+DATE_COLUMNS = ['DOJ', 'Last Working Date', 'DOB']
+SUMMARY_COLUMNS = ['Employee Name', 'Employee ID', 'Rehire', 'FFS']
+MISSING_VALUE = 'Not Available'
+DISPLAY_DATE_FORMAT = '%d-%b-%Y'
+
+SOURCE_NAMES = ['employee_data.parquet', 'employee_data.csv', 'employee_data.xlsx']
+SNAPSHOT_NAME = 'employee_data.arrow'
+DELTA_DIR_NAME = 'employee_data.deltas'
+SNAPSHOT_VERSION = b'3'
+RECORD_COLUMN = '_record'
+KEY_COLUMN = '_key'
+KEY_POSITION_COLUMN = '_key_pos'
+INDEX_COLUMNS = [KEY_COLUMN, KEY_POSITION_COLUMN]
+EPOCH = date(1970, 1, 1)
+MAX_PAGE_SIZE = 1000
+
+_DATASETS = {}
+_DATASETS_LOCK = threading.Lock()
+
+
+def exact_employee_id(value):
+    """Exact lookup key for an Employee ID: trimmed and case-folded."""
+    return str(value).strip().casefold()
+
+
+def normalize_employee_id(value):
+    """Canonical lookup key for an Employee ID.
+
+    Trimmed, case-folded, without a float suffix ("123.0") and without leading
+    zeros, so "010123456", "10123456" and " 010123456 " share one key.
+    """
+    key = exact_employee_id(value)
+    if key.endswith('.0') and key[:-2].isdigit():
+        key = key[:-2]
+    return key.lstrip('0') or key
+
+
+class SortedKeyIndex:
+    """Canonical Employee ID keys in sorted order with their row positions.
+
+    Stored as two snapshot columns and read straight from the memory map, so
+    all workers share one copy. Keys are fixed-width bytes, which numpy can
+    binary search without building Python strings.
+    """
+
+    def __init__(self, keys=None, positions=None):
+        self.keys = np.empty(0, 'S1') if keys is None else keys
+        self.positions = np.empty(0, np.int64) if positions is None else positions
+
+    @staticmethod
+    def build(employee_ids):
+        """Return the (key, position) columns for `employee_ids` in row order."""
+        keys = np.array([normalize_employee_id(v or '').encode() for v in employee_ids], dtype=bytes)
+        order = np.argsort(keys, kind='stable')  # equal keys keep row order
+        keys = keys[order]
+        width = keys.dtype.itemsize
+        key_array = pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(width), len(keys), [None, pa.py_buffer(keys.tobytes())])
+        return key_array, pa.array(order.astype(np.int64))
+
+    @classmethod
+    def from_table(cls, table):
+        if KEY_COLUMN not in table.column_names or table.num_rows == 0:
+            return cls()
+        keys = _single_chunk(table[KEY_COLUMN])
+        width = keys.type.byte_width
+        data = np.frombuffer(keys.buffers()[1], dtype=f'S{width}',
+                             count=len(keys), offset=keys.offset * width)
+        positions = _single_chunk(table[KEY_POSITION_COLUMN]).to_numpy()
+        return cls(data, positions)
+
+    def lookup(self, key):
+        """Row positions whose canonical key is `key`, in row order."""
+        key = key.encode()
+        if not len(self.keys) or len(key) > self.keys.dtype.itemsize:
+            return self.positions[:0]
+        lo = np.searchsorted(self.keys, key, 'left')
+        hi = np.searchsorted(self.keys, key, 'right')
+        return self.positions[lo:hi]
+
+
+def _single_chunk(column):
+    # snapshots are written as one record batch, so this is normally zero-copy
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def with_key_index(table):
+    """Return `table` with freshly built sorted key columns."""
+    table = table.drop_columns([c for c in INDEX_COLUMNS if c in table.column_names])
+    if 'Employee ID' not in table.column_names or table.num_rows == 0:
+        return table
+    keys, positions = SortedKeyIndex.build(table['Employee ID'].to_pylist())
+    return table.append_column(KEY_COLUMN, keys).append_column(KEY_POSITION_COLUMN, positions)
+
+
+class EmployeeIndex:
+    """Hash index from Employee ID variants to row positions.
+
+    Used for rows that are not covered by the snapshot's sorted keys (delta
+    rows). Exact (trimmed, case-folded) IDs win over canonical matches so that
+    two IDs differing only by leading zeros still resolve to their own rows.
+    """
+
+    def __init__(self, employee_ids=()):
+        self.exact = {}
+        self.canonical = {}
+        self.add(employee_ids)
+
+    def add(self, employee_ids, offset=0):
+        """Index `employee_ids` as rows starting at position `offset`."""
+        for pos, emp_id in enumerate(employee_ids, offset):
+            if emp_id is None:
+                continue
+            self.exact.setdefault(exact_employee_id(emp_id), pos)
+            self.canonical.setdefault(normalize_employee_id(emp_id), pos)
+
+    def __contains__(self, employee_id):
+        return exact_employee_id(employee_id) in self.exact
+
+
+def day_number(day):
+    """Days since 1970-01-01, the representation used by Arrow date32."""
+    return (day - EPOCH).days
+
+
+class DobIndex:
+    """Sorted int64 day numbers of the DOB column with their row positions.
+
+    Equality and range queries are two binary searches; rows without a DOB
+    are left out of the index.
+    """
+
+    def __init__(self, dob_column=None):
+        # (days, positions) is swapped as one tuple so readers never see a mix
+        self.sorted = (np.empty(0, np.int64), np.empty(0, np.int64))
+        if dob_column is not None:
+            self.add(dob_column)
+
+    @staticmethod
+    def _valid_days(dob_column, offset):
+        days = dob_column.cast(pa.int32()).to_numpy(zero_copy_only=False)
+        valid = ~pd.isna(days)
+        return days[valid].astype(np.int64), np.flatnonzero(valid) + offset
+
+    def add(self, dob_column, offset=0):
+        """Merge the DOBs of rows starting at position `offset` into the index."""
+        days, positions = self._valid_days(dob_column, offset)
+        order = np.argsort(days, kind='stable')
+        days, positions = days[order], positions[order]
+        old_days, old_positions = self.sorted
+        if len(old_days):
+            at = np.searchsorted(old_days, days, 'right')
+            days = np.insert(old_days, at, days)
+            positions = np.insert(old_positions, at, positions)
+        self.sorted = (days, positions)
+
+    def range(self, start_day=None, end_day=None):
+        """Return (positions, lo, hi) for rows with start_day <= DOB <= end_day."""
+        days, positions = self.sorted
+        lo = 0 if start_day is None else int(np.searchsorted(days, start_day, 'left'))
+        hi = len(days) if end_day is None else int(np.searchsorted(days, end_day, 'right'))
+        return positions, lo, max(lo, hi)
+
+
+class EmployeeDataset:
+    """Read-only view over a memory-mapped employee snapshot.
+
+    Rows appended after the snapshot was written (delta files) are added with
+    `extend`, which patches the ID and DOB indexes in place.
+    """
+
+    def __init__(self, table, key=None):
+        self.key = key
+        self.deltas_key = None
+        self.applied_deltas = set()
+        self.sorted_keys = SortedKeyIndex.from_table(table)
+        table = table.drop_columns([c for c in INDEX_COLUMNS if c in table.column_names])
+        self.index = EmployeeIndex()
+        self.dob_index = DobIndex()
+        self._set_table(table)
+        self.indexed_rows = len(self.sorted_keys.keys)
+        if 'Employee ID' in self.columns and self.indexed_rows < self.num_rows:
+            # no sorted keys in this table (not a snapshot): hash the rows instead
+            self.index.add(table['Employee ID'].slice(self.indexed_rows).to_pylist(), self.indexed_rows)
+        if 'DOB' in self.columns:
+            self.dob_index.add(table['DOB'])
+
+    def _set_table(self, table):
+        self.table = table
+        self.num_rows = table.num_rows
+        self.columns = [c for c in table.column_names if c != RECORD_COLUMN]
+        self.empty = self.num_rows == 0
+
+    def new_rows(self, table, seen=None):
+        """Drop rows of `table` whose Employee ID is already present (or repeated).
+
+        Pass the same `seen` set across chunks of one upload to drop repeats
+        between chunks too.
+        """
+        seen = set() if seen is None else seen
+        keep = []
+        for i, emp_id in enumerate(table['Employee ID'].to_pylist()):
+            key = exact_employee_id(emp_id or '')
+            if key and key not in seen and self._find_exact(key) is None:
+                seen.add(key)
+                keep.append(i)
+        if len(keep) == table.num_rows:
+            return table
+        return table.take(pa.array(keep, pa.int64()))
+
+    def extend(self, table):
+        """Append new rows and patch the indexes; returns the number of rows added."""
+        table = self.new_rows(table)
+        if table.num_rows == 0:
+            return 0
+        offset = self.num_rows
+        if self.table.num_columns == 0:
+            combined = table
+        else:
+            combined = pa.concat_tables([self.table, table], promote_options='default')
+        # table first, indexes second: a reader never gets a position past the table
+        self._set_table(combined)
+        self.index.add(table['Employee ID'].to_pylist(), offset)
+        if 'DOB' in table.column_names:
+            self.dob_index.add(table['DOB'], offset)
+        return table.num_rows
+
+    def _find_exact(self, key, candidates=None):
+        """Row position whose exact key is `key` (see exact_employee_id), or None."""
+        pos = self.index.exact.get(key)
+        if pos is not None:
+            return pos
+        if candidates is None:
+            candidates = self.sorted_keys.lookup(normalize_employee_id(key))
+        for pos in candidates:
+            if exact_employee_id(self.table['Employee ID'][pos].as_py() or '') == key:
+                return int(pos)
+        return None
+
+    def find(self, employee_id):
+        """Return the row position for any accepted form of an Employee ID, or None."""
+        key = exact_employee_id(employee_id)
+        canonical = normalize_employee_id(key)
+        candidates = self.sorted_keys.lookup(canonical)
+        pos = self._find_exact(key, candidates)
+        if pos is None and len(candidates):
+            pos = int(candidates[0])
+        if pos is None:
+            pos = self.index.canonical.get(canonical)
+        return pos
+
+    def record_json(self, pos):
+        """Return the pre-serialized JSON record for a row position."""
+        return self.table[RECORD_COLUMN][pos].as_py()
+
+    def record(self, pos):
+        """Return one row as a display-ready dict."""
+        return _format_record(self.table.select(self.columns).slice(pos, 1).to_pylist()[0])
+
+    def records(self, positions, columns=None):
+        """Return the given rows (optionally a column subset) as display-ready dicts."""
+        columns = self.columns if columns is None else [c for c in columns if c in self.columns]
+        rows = self.table.select(columns).take(pa.array(positions, pa.int64())).to_pylist()
+        return [_format_record(row) for row in rows]
+
+    def dob_positions(self, start, end, offset=0, limit=None):
+        """Return (positions, total) for rows with DOB between start and end (inclusive).
+
+        Either bound may be None for an open range. `offset`/`limit` page
+        through the matches in DOB order.
+        """
+        positions, lo, hi = self.dob_index.range(
+            None if start is None else day_number(start),
+            None if end is None else day_number(end),
+        )
+        total = hi - lo
+        lo = min(hi, lo + offset)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return positions[lo:hi].tolist(), total
+
+
+def _format_record(row):
+    """Apply the display conventions used by the UI (dates, missing values)."""
+    for col, value in row.items():
+        if value is None:
+            row[col] = MISSING_VALUE
+        elif col in DATE_COLUMNS and hasattr(value, 'strftime'):
+            row[col] = value.strftime(DISPLAY_DATE_FORMAT)
+    return row
+
+
+def parse_dob_query(args):
+    """Parse `dob` or `dob_from`/`dob_to` plus optional `page`/`per_page` query args.
+
+    Returns (start, end, offset, limit); raises ValueError on bad input.
+    """
+    def _date(name):
+        value = args.get(name)
+        if not value:
+            return None
+        try:
+            return pd.to_datetime(value).date()
+        except Exception:
+            raise ValueError('Invalid date format')
+
+    start = end = _date('dob')
+    if start is None:
+        start, end = _date('dob_from'), _date('dob_to')
+        if start is None and end is None:
+            raise ValueError('Date of Birth is required')
+        if start is not None and end is not None and start > end:
+            raise ValueError('dob_from must not be after dob_to')
+
+    offset, limit = 0, None
+    if args.get('page') or args.get('per_page'):
+        try:
+            page = int(args.get('page') or 1)
+            limit = int(args.get('per_page') or 100)
+        except ValueError:
+            page = limit = 0
+        if page < 1 or limit < 1:
+            raise ValueError('page and per_page must be positive integers')
+        limit = min(limit, MAX_PAGE_SIZE)
+        offset = (page - 1) * limit
+    return start, end, offset, limit
+
+
+# -------------------- NORMALIZATION --------------------
+
+def _find_employee_id_column(columns):
+    if 'Employee ID' in columns:
+        return 'Employee ID'
+    for c in columns:
+        lc = c.lower()
+        if 'employee' in lc and 'id' in lc:
+            return c
+    return None
+
+
+def normalize_frame(df):
+    """Normalize an uploaded employee frame into the snapshot column types.
+
+    Employee ID and free-text columns become strings, `FFS` becomes numeric and
+    the date columns become calendar dates. Missing values stay null so the
+    Arrow columns keep a single type; they are rendered as 'Not Available'
+    when a record is served.
+    """
+    df = df.copy()
+    df.columns = df.columns.astype(str).str.strip()
+
+    emp_col = _find_employee_id_column(list(df.columns))
+    if emp_col is None:
+        raise ValueError('Employee ID column missing')
+    if emp_col != 'Employee ID':
+        df = df.rename(columns={emp_col: 'Employee ID'})
+
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], errors='coerce').dt.normalize()
+        elif col == 'FFS':
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            df[col] = df[col].astype('string').str.strip()
+
+    # Excel turns numeric IDs into floats ("10123456.0"); keep the digits only
+    df['Employee ID'] = df['Employee ID'].str.replace(r'\.0$', '', regex=True)
+    df = df[df['Employee ID'].fillna('') != '']
+    return df.reset_index(drop=True)
+
+
+def frame_to_table(df, record_columns=()):
+    """Convert a normalized frame into an Arrow table with stable column types.
+
+    A `_record` column with the display-ready JSON of each row is appended.
+    Columns in `record_columns` (the stored dataset's) that the frame lacks
+    appear in each record as 'Not Available'.
+    """
+    arrays, fields = [], []
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            arr = pa.Array.from_pandas(df[col]).cast(pa.date32())
+        elif col == 'FFS':
+            arr = pa.Array.from_pandas(df[col].astype('float64'))
+        else:
+            arr = pa.Array.from_pandas(df[col]).cast(pa.string())
+        arrays.append(arr)
+        fields.append(pa.field(col, arr.type))
+    table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+    # Serialize every record once here so lookups can return it as-is
+    missing = dict.fromkeys(c for c in record_columns if c not in table.column_names)
+    records = [json.dumps(_format_record({**missing, **row}), sort_keys=True) for row in table.to_pylist()]
+    return table.append_column(RECORD_COLUMN, pa.array(records, pa.string()))
+
+
+# -------------------- SNAPSHOT FILES --------------------
+
+def snapshot_path(base_dir):
+    return os.path.join(base_dir, SNAPSHOT_NAME)
+
+
+def source_path(base_dir):
+    """Return the first existing upload source (parquet, CSV, Excel) or None."""
+    for name in SOURCE_NAMES:
+        path = os.path.join(base_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _source_signature(path):
+    st = os.stat(path)
+    return f'{os.path.basename(path)}:{st.st_mtime_ns}:{st.st_size}'.encode()
+
+
+def _read_source(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if path.endswith('.csv'):
+        return pd.read_csv(path, dtype={'Employee ID': str})
+    return pd.read_excel(path, engine='openpyxl')
+
+
+@contextmanager
+def _build_lock(base_dir):
+    """Serialize snapshot rebuilds across gunicorn workers."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(base_dir, exist_ok=True)
+    with open(snapshot_path(base_dir) + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _snapshot_is_fresh(base_dir, source):
+    path = snapshot_path(base_dir)
+    if not os.path.exists(path):
+        return False
+    try:
+        with pa.memory_map(path, 'r') as source_file:
+            metadata = pa.ipc.open_file(source_file).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+    return (metadata.get(b'snapshot_version') == SNAPSHOT_VERSION
+            and metadata.get(b'source') == _source_signature(source))
+
+
+def write_snapshot(base_dir, table, source=None):
+    """Atomically replace the snapshot with `table`."""
+    metadata = {b'snapshot_version': SNAPSHOT_VERSION}
+    if source is not None:
+        metadata[b'source'] = _source_signature(source)
+    # one record batch, so every column maps back as a single zero-copy chunk
+    table = with_key_index(table).combine_chunks().replace_schema_metadata(metadata)
+
+    path = snapshot_path(base_dir)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def build_snapshot(base_dir, force=False):
+    """Rebuild the snapshot from the upload source unless it is already current."""
+    with _build_lock(base_dir):
+        return _build_snapshot_locked(base_dir, force)
+
+
+def _build_snapshot_locked(base_dir, force):
+    source = source_path(base_dir)
+    if source is None:
+        remove_snapshot(base_dir)
+        return False
+    if not force and _snapshot_is_fresh(base_dir, source):
+        return False
+    table = frame_to_table(normalize_frame(_read_source(source)))
+    write_snapshot(base_dir, table, source)
+    return True
+
+
+def replace_dataset(base_dir, chunks, progress=None):
+    """Replace the stored dataset with the rows of `chunks` (an iterable of frames).
+
+    Chunks are normalized and streamed into a new base parquet; the parquet,
+    pending deltas and snapshot are then swapped under the build lock, so
+    readers keep the old data until the new snapshot is in place.
+    `progress(rows_parsed)` is called after each chunk. Returns the row count.
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    parquet = os.path.join(base_dir, SOURCE_NAMES[0])
+    tmp_path = f'{parquet}.{os.getpid()}.{threading.get_ident()}.tmp'
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            rows += len(chunk)
+            table = frame_to_table(normalize_frame(chunk)).drop_columns([RECORD_COLUMN])
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table.select(writer.schema.names).cast(writer.schema))
+            if progress is not None:
+                progress(rows)
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    if writer is None:
+        raise ValueError('Uploaded file has no rows')
+    writer.close()
+
+    with _build_lock(base_dir):
+        os.replace(tmp_path, parquet)
+        clear_deltas(base_dir)
+        _build_snapshot_locked(base_dir, force=True)
+    return rows
+
+
+def remove_snapshot(base_dir):
+    path = snapshot_path(base_dir)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _snapshot_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _map_snapshot(path, key):
+    if key is None:
+        return EmployeeDataset(pa.table({}), key)
+    # read_all() on a memory map is zero-copy: the buffers point into the file
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return EmployeeDataset(table, key)
+
+
+# -------------------- DELTA FILES --------------------
+
+def deltas_dir(base_dir):
+    return os.path.join(base_dir, DELTA_DIR_NAME)
+
+
+def list_deltas(base_dir):
+    """Delta file names in write order."""
+    try:
+        names = os.listdir(deltas_dir(base_dir))
+    except FileNotFoundError:
+        return []
+    return sorted(n for n in names if n.endswith('.parquet'))
+
+
+def _deltas_key(base_dir):
+    # Adding or removing a delta file bumps the directory mtime
+    try:
+        return os.stat(deltas_dir(base_dir)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _apply_deltas(base_dir, dataset):
+    for name in list_deltas(base_dir):
+        if name in dataset.applied_deltas:
+            continue
+        try:
+            table = pq.read_table(os.path.join(deltas_dir(base_dir), name))
+        except FileNotFoundError:
+            continue  # compacted away by another worker
+        dataset.extend(table)
+        dataset.applied_deltas.add(name)
+
+
+def clear_deltas(base_dir):
+    for name in list_deltas(base_dir):
+        try:
+            os.remove(os.path.join(deltas_dir(base_dir), name))
+        except FileNotFoundError:
+            pass
+
+
+def append_rows(base_dir, frames):
+    """Append the rows whose Employee ID is not stored yet.
+
+    `frames` is a DataFrame or an iterable of DataFrame chunks. Only the new
+    rows are written, as one delta parquet file, and the current process's
+    indexes are patched in place. Returns the number of rows added.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    get_dataset(base_dir)
+    with _build_lock(base_dir):
+        dataset = get_dataset(base_dir)
+        directory = deltas_dir(base_dir)
+        os.makedirs(directory, exist_ok=True)
+        name = f'part-{time.time_ns():020d}-{os.getpid()}.parquet'
+        tmp_path = os.path.join(directory, f'.{name}.tmp')
+
+        writer = None
+        seen = set()
+        added = []
+        try:
+            for frame in frames:
+                table = frame_to_table(normalize_frame(frame), dataset.columns)
+                table = dataset.new_rows(table, seen)
+                if table.num_rows == 0:
+                    continue
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table.select(writer.schema.names).cast(writer.schema))
+                added.append(table)
+        except Exception:
+            if writer is not None:
+                writer.close()
+                os.remove(tmp_path)
+            raise
+        if not added:
+            return 0
+        writer.close()
+        os.replace(tmp_path, os.path.join(directory, name))
+
+        with _DATASETS_LOCK:
+            dataset.extend(pa.concat_tables(added))
+            dataset.applied_deltas.add(name)
+        return sum(t.num_rows for t in added)
+
+
+def compact(base_dir):
+    """Fold all delta files into the base parquet and snapshot.
+
+    Safe to run while other workers serve requests: the snapshot is swapped
+    atomically and delta rows that reappear are skipped as duplicates.
+    """
+    with _build_lock(base_dir):
+        names = list_deltas(base_dir)
+        if not names:
+            return False
+        path = snapshot_path(base_dir)
+        dataset = _map_snapshot(path, _snapshot_key(path))
+        for name in names:
+            dataset.extend(pq.read_table(os.path.join(deltas_dir(base_dir), name)))
+
+        table = dataset.table
+        parquet = os.path.join(base_dir, SOURCE_NAMES[0])
+        tmp_path = f'{parquet}.{os.getpid()}.tmp'
+        pq.write_table(table.drop_columns([RECORD_COLUMN]).replace_schema_metadata(None), tmp_path)
+        os.replace(tmp_path, parquet)
+        write_snapshot(base_dir, table, parquet)
+
+        for name in names:
+            os.remove(os.path.join(deltas_dir(base_dir), name))
+        return True
+
+
+def get_dataset(base_dir):
+    """Return the current dataset for `base_dir`.
+
+    Re-maps the snapshot if another worker replaced it and applies any delta
+    files this process has not seen yet.
+    """
+    path = snapshot_path(base_dir)
+    key = _snapshot_key(path)
+    deltas_key = _deltas_key(base_dir)
+    dataset = _DATASETS.get(base_dir)
+    if dataset is not None and dataset.key == key and dataset.deltas_key == deltas_key:
+        return dataset
+
+    with _DATASETS_LOCK:
+        dataset = _DATASETS.get(base_dir)
+        if dataset is None:
+            # First access in this process: make sure the snapshot matches the source
+            try:
+                build_snapshot(base_dir)
+            except Exception:
+                pass
+            key = _snapshot_key(path)
+        if dataset is None or dataset.key != key:
+            try:
+                dataset = _map_snapshot(path, key)
+            except (OSError, pa.ArrowInvalid):
+                dataset = EmployeeDataset(pa.table({}), None)
+            _DATASETS[base_dir] = dataset
+        if dataset.deltas_key != deltas_key:
+            _apply_deltas(base_dir, dataset)
+            dataset.deltas_key = deltas_key
+        return dataset
@@ -6,7 +6,9 @@ REPLICATED from old working project
 from flask import Blueprint, render_template, request, jsonify, current_app, send_file
 import pandas as pd
 import os
+import threading
 from werkzeug.utils import secure_filename
+from tools import employee_store, spreadsheet_reader
 
 exit_verifier_bp = Blueprint(
     'exit_verifier',
@@ -15,91 +17,37 @@ exit_verifier_bp = Blueprint(
     url_prefix='/exit-verifier'
 )
 
-DATA_DF = None
-DATE_COLUMNS = ['DOJ', 'Last Working Date', 'DOB']
 
+# -------------------- LOAD DATA (SHARED SNAPSHOT) --------------------
+def _data_dir():
+    return os.path.join(current_app.root_path, 'data', 'uploads')
 
-# -------------------- LOAD DATA (OLD PROJECT STYLE) --------------------
-def load_data():
-    global DATA_DF
-    if DATA_DF is not None:
-        return DATA_DF
-
-    base = os.path.join(current_app.root_path, 'data', 'uploads')
-    parquet = os.path.join(base, 'employee_data.parquet')
-    csv = os.path.join(base, 'employee_data.csv')
-
-    if os.path.exists(parquet):
-        df = pd.read_parquet(parquet)
-    elif os.path.exists(csv):
-        # 🔴 CRITICAL FIX: force Employee ID as STRING
-        df = pd.read_csv(csv, dtype={'Employee ID': str})
-    else:
-        DATA_DF = pd.DataFrame()
-        return DATA_DF
-
-    # Clean column names
-    df.columns = df.columns.astype(str).str.strip()
 
-    if 'Employee ID' not in df.columns:
-        DATA_DF = pd.DataFrame()
-        return DATA_DF
-
-    # 🔴 CRITICAL FIX: ensure string + preserve leading zero
-    df['Employee ID'] = df['Employee ID'].astype(str).str.strip()
-
-    # EXACTLY like old project
-    df.set_index('Employee ID', inplace=True)
-
-    # Parse dates
-    for col in DATE_COLUMNS:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
+def load_data():
+    """Return the shared, memory-mapped employee dataset."""
+    return employee_store.get_dataset(_data_dir())
 
-    df = df.fillna('Not Available')
 
-    DATA_DF = df
-    return DATA_DF
 def append_and_save_data(new_df):
-    base = os.path.join(current_app.root_path, 'data', 'uploads')
-    parquet = os.path.join(base, 'employee_data.parquet')
-    csv = os.path.join(base, 'employee_data.csv')
-
-    # Load existing
-    if os.path.exists(parquet):
-        existing_df = pd.read_parquet(parquet)
-    elif os.path.exists(csv):
-        existing_df = pd.read_csv(csv)
-    else:
-        existing_df = pd.DataFrame()
-
-    # Normalize columns
-    existing_df.columns = existing_df.columns.astype(str).str.strip()
-    new_df.columns = new_df.columns.astype(str).str.strip()
+    """Append rows with new Employee IDs as a delta file; returns the count added.
 
-    # Ensure Employee ID exists
-    if 'Employee ID' not in new_df.columns:
-        raise ValueError('Employee ID column missing')
+    Cost is proportional to the upload, not the stored history. Once enough
+    deltas pile up they are compacted into the base parquet in the background.
+    """
+    base = _data_dir()
+    added = employee_store.append_rows(base, new_df)  # DataFrame or iterable of chunks
 
-    # Normalize Employee ID as STRING (DO NOT STRIP 0)
-    new_df['Employee ID'] = new_df['Employee ID'].astype(str).str.strip()
-    if not existing_df.empty:
-        existing_df['Employee ID'] = existing_df['Employee ID'].astype(str).str.strip()
+    compact_after = current_app.config.get('TOOLS', {}).get('exit_verifier', {}).get('compact_after_deltas', 8)
+    if len(employee_store.list_deltas(base)) >= compact_after:
+        threading.Thread(target=_compact_quietly, args=(base, current_app.logger), daemon=True).start()
+    return added
 
-    # Remove duplicates (Employee ID based)
-    if not existing_df.empty:
-        new_df = new_df[~new_df['Employee ID'].isin(existing_df['Employee ID'])]
 
-    # Append
-    final_df = pd.concat([existing_df, new_df], ignore_index=True)
-
-    # Save
+def _compact_quietly(base, logger):
     try:
-        final_df.to_parquet(parquet, index=False)
-        return 'parquet'
+        employee_store.compact(base)
     except Exception:
-        final_df.to_csv(csv, index=False)
-        return 'csv'
+        logger.exception('Employee data compaction failed')
 
 
 # -------------------- ROUTES --------------------
@@ -116,68 +64,49 @@ def verify_exit():
     if not raw_id:
         return jsonify({'error': 'Employee ID is required'}), 400
 
-    df = load_data()
-    if df.empty:
+    dataset = load_data()
+    if dataset.empty:
         return jsonify({'error': 'Employee database not loaded'}), 500
 
-    # 🔑 SEARCH KEYS (do NOT mutate data)
-    search_ids = {raw_id}
-    if raw_id.startswith('0'):
-        search_ids.add(raw_id.lstrip('0'))
-
-    found_id = None
-    for sid in search_ids:
-        if sid in df.index:
-            found_id = sid
-            break
-
-    if not found_id:
+    # 🔑 One index lookup handles leading zeros, spacing and case
+    found_pos = dataset.find(raw_id)
+    if found_pos is None:
         return jsonify({'message': 'EMP ID is not active or not found'}), 404
 
-    record = df.loc[found_id].to_dict()
-    record['Employee ID'] = found_id  # display real ID only
-
-    for col in DATE_COLUMNS:
-        if col in record and isinstance(record[col], pd.Timestamp):
-            record[col] = record[col].strftime('%d-%b-%Y')
-
-    return jsonify({'success': True, 'data': record})
+    body = f'{{"data": {dataset.record_json(found_pos)}, "success": true}}'
+    return current_app.response_class(body, mimetype='application/json')
 
 
 
 @exit_verifier_bp.route('/filter_by_dob_summary', methods=['GET'])
 def filter_by_dob_summary():
-    dob = request.args.get('dob')
-    if not dob:
+    if not any(request.args.get(k) for k in ('dob', 'dob_from', 'dob_to')):
         return jsonify({'error': 'Date of Birth is required'}), 400
 
-    df = load_data()
-    if df.empty:
+    dataset = load_data()
+    if dataset.empty:
         return jsonify({'error': 'Employee database not loaded'}), 500
 
     try:
-        search_date = pd.to_datetime(dob)
-    except Exception:
-        return jsonify({'error': 'Invalid date format'}), 400
+        start, end, offset, limit = employee_store.parse_dob_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    if 'DOB' not in df.columns:
+    if 'DOB' not in dataset.columns:
         return jsonify({'error': 'DOB column not found'}), 500
 
-    result_df = df[df['DOB'] == search_date]
+    # Binary search over the sorted DOB index (exact date or range, paged)
+    positions, total = dataset.dob_positions(start, end, offset, limit)
 
-    if result_df.empty:
+    if not total:
         return jsonify({'message': 'No employees found with this DOB'}), 404
 
-    # 🔴 EXACT OLD PROJECT FIX
-    summary_df = result_df.reset_index()[['Employee Name', 'Employee ID', 'Rehire', 'FFS']]
-    return jsonify({'success': True, 'data': summary_df.to_dict('records')})
+    summary = dataset.records(positions, employee_store.SUMMARY_COLUMNS)
+    return jsonify({'success': True, 'data': summary, 'total': total})
 
 
 @exit_verifier_bp.route('/configure', methods=['POST'])
 def configure_data():
-    global DATA_DF
-    DATA_DF = None  # force reload
-
     if 'file' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
 
@@ -188,17 +117,18 @@ def configure_data():
     if ext not in ['.xls', '.xlsx', '.csv']:
         return jsonify({'error': 'Unsupported file type'}), 400
 
-    try:
-        new_df = pd.read_excel(f) if ext != '.csv' else pd.read_csv(f)
-    except Exception as e:
-        return jsonify({'error': f'Failed to read file: {str(e)}'}), 400
+    # Rows are parsed chunk by chunk while they are appended
+    chunks = spreadsheet_reader.iter_chunks(f.stream, ext, dtype={'Employee ID': str})
 
     try:
-        saved_type = append_and_save_data(new_df)
+        added = append_and_save_data(chunks)
         return jsonify({
             'success': True,
-            'message': f'Data appended successfully and saved as {saved_type.upper()}.'
+            'added': added,
+            'message': f'Data appended successfully: {added} new record(s) saved.'
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 @exit_verifier_bp.route('/download-template', methods=['GET'])
@@ -242,8 +172,9 @@ def reset_data():
         if os.path.exists(csv):
             os.remove(csv)
 
-        global DATA_DF
-        DATA_DF = None  # reset in-memory data
+        # drop the shared snapshot and deltas; workers see an empty dataset on their next request
+        employee_store.clear_deltas(base)
+        employee_store.remove_snapshot(base)
 
         return jsonify({'success': True, 'message': 'Employee data has been reset.'})
     except Exception as e:
@@ -11,79 +11,153 @@ Features:
 """
 
 from flask import Blueprint, render_template, request, jsonify, current_app
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
+import hashlib
+import json
 import re
+import threading
+import time
+import numpy as np
 import pandas as pd
 import os
+import shutil
+import tempfile
 import zipfile
-from io import BytesIO
+from tools import id_registry, spreadsheet_reader
 
 id_checker_bp = Blueprint('id_checker', __name__,
                          template_folder='templates',
                          url_prefix='/id-checker')
 
-# Mock database for used IDs
-used_ids = {
-    'EMP0001', 'EMP0002', 'EMP0003', 'EMP0005', 'EMP0010',
-    'USER0001', 'USER0002', 'STF0001', 'STF0003'
-}
-
-# Reserved IDs
-reserved_ids = {
-    'EMP0000', 'USER0000', 'STF0000'
-}
-
-def generate_next_available_id(prefix='EMP', start=1):
-    """Generate the next available ID with given prefix."""
-    pattern = re.compile(f'^{prefix}(\\d+)$')
-
-    # Find existing IDs with this prefix
-    existing_numbers = []
-    for used_id in used_ids:
-        match = pattern.match(used_id)
-        if match:
-            existing_numbers.append(int(match.group(1)))
-
-    if not existing_numbers:
-        return f"{prefix}{start:04d}"
-
-    # Find next available number
-    max_number = max(existing_numbers)
-    next_number = max(max_number + 1, start)
-
-    while f"{prefix}{next_number:04d}" in used_ids:
-        next_number += 1
-
-    return f"{prefix}{next_number:04d}"
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_id_registry():
+    """Shared ID registry stored in the app's SQLite database."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            settings = current_app.config.get('TOOLS', {}).get('id_checker', {})
+            path = id_registry.database_path(current_app.config.get('SQLALCHEMY_DATABASE_URI'),
+                                             current_app.root_path)
+            if path is None:
+                # non-SQLite DATABASE_URL: keep the registry in a local SQLite file
+                path = os.path.join(current_app.root_path, 'data', 'id_registry.db')
+            prefixes = [id_registry.pattern_prefix(p) for p in settings.get('id_patterns', [])]
+            prefixes += [rule['prefix'] for rule in settings.get('location_rules', DEFAULT_LOCATION_RULES)]
+            registry = id_registry.IdRegistry(path, prefixes)
+            registry.seed_reserved(settings.get('reserved_ids', []))
+            _registry = registry
+    return _registry
+
+
+def id_width(prefix):
+    """Digit width for IDs with `prefix`: configured pattern, else registry majority, else 4."""
+    patterns = current_app.config.get('TOOLS', {}).get('id_checker', {}).get('id_patterns', [])
+    for pattern in patterns:
+        if id_registry.pattern_prefix(pattern) == prefix:
+            return len(pattern) - len(prefix)
+    return get_id_registry().default_width(prefix) or id_registry.DEFAULT_WIDTH
+
+
+def generate_next_available_id(prefix='EMP', start=1, width=None):
+    """Generate the next available ID with given prefix.
+
+    Counts on from the highest used ID (reservations do not move it) and
+    skips any number that is already registered.
+    """
+    width = width or id_width(prefix)
+    registry = get_id_registry()
+    max_used = registry.max_used(prefix)
+    number = start if max_used is None else max(max_used + 1, start)
+    free = registry.free_numbers(prefix, width, number, 1)
+    return f"{prefix}{(free[0] if free else number):0{width}d}"
 
 @id_checker_bp.route('/')
 def index():
     """Main page for the Employee ID Availability Checker tool."""
     return render_template('tools/id_checker.html')
 
+def _parse_id_list(values):
+    """Flatten form/JSON ID entries; each entry may be a pasted list split by commas/whitespace."""
+    if isinstance(values, str):
+        values = [values]
+    return [i for entry in values or () for i in re.split(r'[\s,]+', str(entry)) if i]
+
+
+def _availability_runs(ids, available):
+    """Run-length summary: consecutive numbers with the same availability, per prefix/width."""
+    registry = get_id_registry()
+    parsed = {}
+    for emp_id, is_available in zip(ids, available):
+        prefix, number, width = registry.split(emp_id)
+        if number is not None:
+            parsed[(prefix, width, number)] = bool(is_available)
+
+    runs = []
+    for (prefix, width, number), is_available in sorted(parsed.items()):
+        last = runs[-1] if runs else None
+        if (last and last['prefix'] == prefix and last['width'] == width
+                and last['available'] == is_available and last['last_number'] == number - 1):
+            last['last_number'] = number
+            last['count'] += 1
+        else:
+            runs.append({'prefix': prefix, 'width': width, 'first_number': number,
+                         'last_number': number, 'count': 1, 'available': is_available})
+    for run in runs:
+        run['first'] = f"{run['prefix']}{run['first_number']:0{run['width']}d}"
+        run['last'] = f"{run['prefix']}{run['last_number']:0{run['width']}d}"
+    return runs
+
+
 @id_checker_bp.route('/check', methods=['POST'])
 def check_availability():
-    """Check availability of specific IDs."""
+    """Check availability of specific IDs.
+
+    `mode` selects the response shape: 'full' (default) lists every ID,
+    'unavailable' lists only used/reserved IDs and 'runs' returns run-length
+    summaries of consecutive IDs.
+    """
     try:
-        ids_to_check = request.form.getlist('ids')
-        results = []
+        payload = request.get_json(silent=True)
+        if payload is None:
+            ids_to_check = _parse_id_list(request.form.getlist('ids'))
+            mode = request.form.get('mode', 'full')
+        else:
+            ids_to_check = _parse_id_list(payload.get('ids'))
+            mode = payload.get('mode', 'full')
+        if mode not in ('full', 'unavailable', 'runs'):
+            return jsonify({'error': "mode must be 'full', 'unavailable' or 'runs'"}), 400
+
+        registry = get_id_registry()
+        occupied = registry.occupied(ids_to_check)
+        available_count = int(len(ids_to_check) - occupied.sum())
+        response = {
+            'success': True,
+            'total_checked': len(ids_to_check),
+            'available_count': available_count
+        }
 
-        for emp_id in ids_to_check:
-            is_available = emp_id not in used_ids and emp_id not in reserved_ids
-            status = 'available' if is_available else 'used' if emp_id in used_ids else 'reserved'
+        if mode == 'runs':
+            response['runs'] = _availability_runs(ids_to_check, ~occupied)
+            return jsonify(response)
 
-            results.append({
-                'id': emp_id,
-                'available': is_available,
-                'status': status
-            })
+        # statuses are only looked up for the (usually few) registered IDs
+        registered = registry.statuses([i for i, taken in zip(ids_to_check, occupied) if taken])
+        if mode == 'unavailable':
+            response['unavailable'] = [{'id': emp_id, 'status': registered[emp_id]}
+                                       for emp_id in dict.fromkeys(ids_to_check) if emp_id in registered]
+            return jsonify(response)
 
-        return jsonify({
-            'success': True,
-            'results': results,
-            'total_checked': len(results),
-            'available_count': len([r for r in results if r['available']])
-        })
+        response['results'] = [{
+            'id': emp_id,
+            'available': emp_id not in registered,
+            'status': registered.get(emp_id, 'available')
+        } for emp_id in ids_to_check]
+        return jsonify(response)
 
     except Exception as e:
         return jsonify({'error': f'Check failed: {str(e)}'}), 500
@@ -95,31 +169,23 @@ def generate_ids():
         prefix = request.form.get('prefix', 'EMP')
         count = int(request.form.get('count', 1))
         start_number = int(request.form.get('start_number', 1))
+        width = request.form.get('width', type=int) or id_width(prefix)
 
-        generated_ids = []
-        current_number = start_number
+        # free numbers are the gaps between occupied runs; cost ~ count, not the occupied span
+        numbers = get_id_registry().free_numbers(prefix, width, start_number, count)
+        generated_ids = [f"{prefix}{n:0{width}d}" for n in numbers]
 
-        for _ in range(count):
-            while True:
-                candidate_id = f"{prefix}{current_number:04d}"
-
-                if candidate_id not in used_ids and candidate_id not in reserved_ids:
-                    generated_ids.append(candidate_id)
-                    current_number += 1
-                    break
-                else:
-                    current_number += 1
-
-                    # Safety check to prevent infinite loop
-                    if current_number > start_number + 10000:
-                        break
-
-        return jsonify({
+        response = {
             'success': True,
             'generated_ids': generated_ids,
             'prefix': prefix,
+            'width': width,
             'count': len(generated_ids)
-        })
+        }
+        if len(generated_ids) < count:
+            response['warning'] = (f'Only {len(generated_ids)} of {count} IDs available: '
+                                   f'{prefix} IDs with {width} digits are exhausted')
+        return jsonify(response)
 
     except Exception as e:
         return jsonify({'error': f'Generation failed: {str(e)}'}), 500
@@ -135,13 +201,10 @@ def reserve_id():
         if not emp_id:
             return jsonify({'error': 'ID is required'}), 400
 
-        if emp_id in used_ids:
-            return jsonify({'error': 'ID is already in use'}), 400
-
-        if emp_id in reserved_ids:
-            return jsonify({'error': 'ID is already reserved'}), 400
-
-        reserved_ids.add(emp_id)
+        try:
+            get_id_registry().reserve(emp_id, reason=reason, actor=reserved_by)
+        except id_registry.IdConflict as e:
+            return jsonify({'error': str(e)}), 400
 
         return jsonify({
             'success': True,
@@ -164,13 +227,11 @@ def allocate_id():
         if not emp_id:
             return jsonify({'error': 'ID is required'}), 400
 
-        if emp_id in used_ids:
-            return jsonify({'error': 'ID is already allocated'}), 400
-
-        if emp_id in reserved_ids:
-            reserved_ids.remove(emp_id)
-
-        used_ids.add(emp_id)
+        try:
+            get_id_registry().allocate(emp_id, employee_name=employee_name,
+                                       department=department, actor=allocated_by)
+        except id_registry.IdConflict as e:
+            return jsonify({'error': str(e)}), 400
 
         return jsonify({
             'success': True,
@@ -187,22 +248,96 @@ def allocate_id():
     except Exception as e:
         return jsonify({'error': f'Allocation failed: {str(e)}'}), 500
 
+@id_checker_bp.route('/bulk', methods=['POST'])
+def bulk_ids():
+    """Reserve or allocate a batch of IDs atomically.
+
+    Accepts JSON or form fields: `action` ('reserve' or 'allocate') and either
+    `ids` (a list) or `count` with `prefix`, optional `width` and `start_number`.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if payload is None:
+            payload = request.form.to_dict()
+            payload['ids'] = request.form.getlist('ids') or None
+
+        action = payload.get('action', 'reserve')
+        ids = _parse_id_list(payload.get('ids'))
+        actor = payload.get('actor') or payload.get('reserved_by') or payload.get('allocated_by') or 'User'
+        max_ids = current_app.config.get('TOOLS', {}).get('id_checker', {}).get('bulk_max_ids', 5000)
+
+        if action not in ('reserve', 'allocate'):
+            return jsonify({'error': "action must be 'reserve' or 'allocate'"}), 400
+        if ids:
+            count, prefix, width, start_number = None, None, None, None
+        else:
+            ids = None
+            count = int(payload.get('count') or 0)
+            prefix = payload.get('prefix', 'EMP')
+            width = int(payload.get('width') or 0) or id_width(prefix)
+            start_number = int(payload.get('start_number') or 1)
+            if count <= 0:
+                return jsonify({'error': 'Provide ids or a positive count'}), 400
+        if len(ids or ()) > max_ids or (count or 0) > max_ids:
+            return jsonify({'error': f'Batch too large (max {max_ids} IDs)'}), 400
+
+        atomic = str(payload.get('atomic', '')).lower() in ('1', 'true', 'yes')
+        try:
+            results, batch_id = get_id_registry().bulk(
+                action, ids=ids, count=count, prefix=prefix, width=width, start=start_number,
+                actor=actor, reason=payload.get('reason'), employee_name=payload.get('employee_name'),
+                department=payload.get('department'), atomic=atomic)
+        except id_registry.BatchConflict as e:
+            return jsonify({'success': False, 'error': str(e), 'batch_id': e.batch_id, 'results': e.results}), 409
+
+        succeeded = sum(1 for r in results if r['success'])
+        response = {
+            'success': True,
+            'action': action,
+            'batch_id': batch_id,
+            'results': results,
+            'requested': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
+        }
+        if count and len(results) < count:
+            response['warning'] = f'Only {len(results)} of {count} IDs available'
+        return jsonify(response)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Bulk operation failed: {str(e)}'}), 500
+
+@id_checker_bp.route('/audit')
+def get_audit_log():
+    """Recent bulk batches (committed and rolled back), newest first; `limit` defaults to 50."""
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        return jsonify({'success': True, 'entries': get_id_registry().audit_log(limit)})
+    except Exception as e:
+        return jsonify({'error': f'Audit log failed: {str(e)}'}), 500
+
 @id_checker_bp.route('/stats')
 def get_statistics():
     """Get ID allocation statistics."""
     try:
+        registry_stats = get_id_registry().stats()
         stats = {
-            'total_used': len(used_ids),
-            'total_reserved': len(reserved_ids),
+            'total_used': registry_stats['total_used'],
+            'total_reserved': registry_stats['total_reserved'],
             'by_prefix': {}
         }
 
-        # Count by prefix
-        prefixes = ['EMP', 'USER', 'STF']
-        for prefix in prefixes:
-            pattern = re.compile(f'^{prefix}(\\d+)$')
-            count = len([id for id in used_ids if pattern.match(id)])
-            stats['by_prefix'][prefix] = count
+        # Used count by prefix: configured patterns first, then any other registered prefix
+        patterns = current_app.config.get('TOOLS', {}).get('id_checker', {}).get('id_patterns', [])
+        for prefix in [id_registry.pattern_prefix(p) for p in patterns]:
+            stats['by_prefix'][prefix] = 0
+        for prefix, counts in registry_stats['prefixes'].items():
+            stats['by_prefix'][prefix] = counts['used']
 
         return jsonify({
             'success': True,
@@ -213,134 +348,317 @@ def get_statistics():
         return jsonify({'error': f'Stats failed: {str(e)}'}), 500
 
 
-def _safe_str(v):
-    if pd.isna(v):
-        return ''
-    return str(v).strip()
+# Roster layout: Employee ID in column A, DOJ in column F, location in column S
+ROSTER_EMP_COL = 0
+ROSTER_DOJ_COL = 5
+ROSTER_LOC_COL = 18
+# Longer digit tails may not fit int64 and are parsed with Python ints instead
+INT64_SAFE_DIGITS = len(str(id_registry.MAX_NUMBER)) - 1
+
+# Default location -> prefix rules; overridden by TOOLS['id_checker']['location_rules']
+DEFAULT_LOCATION_RULES = [
+    {'group': 'bangalore_shillong', 'prefix': '010', 'aliases': ['bangalore', 'blr', 'bengaluru', 'shillong']},
+    {'group': 'hyderabad', 'prefix': '030', 'aliases': ['hyderabad', 'hyd']},
+]
+
+
+class LocationMatcher:
+    """Location text -> group matcher compiled once from a rule table.
+
+    All rules become one regex of ordered lookaheads, so the first rule with
+    an alias anywhere in the text wins, exactly like an if/elif chain.
+    """
+
+    def __init__(self, rules):
+        self.groups = {}
+        branches = []
+        for i, rule in enumerate(rules):
+            self.groups.setdefault(rule['group'], rule['prefix'])
+            aliases = '|'.join(re.escape(a.lower()) for a in rule['aliases'])
+            branches.append(f'(?=.*?(?:{aliases}))(?P<r{i}>)')
+        self.rule_groups = [rule['group'] for rule in rules]
+        self.regex = re.compile('|'.join(branches), re.DOTALL)
+
+    def match(self, text):
+        """Return the group key for one (lower-cased) location, or None."""
+        m = self.regex.match(text)
+        return self.rule_groups[int(m.lastgroup[1:])] if m else None
+
+    def classify(self, locations):
+        """Map a Series of lower-cased locations to group keys (None if unmatched).
+
+        The regex runs once per distinct location string, not once per row.
+        """
+        codes, uniques = pd.factorize(locations)
+        keys = np.array([self.match(u) for u in uniques] + [None], dtype=object)
+        return pd.Series(keys[codes], index=locations.index)
+
+
+@lru_cache(maxsize=8)
+def _compiled_matcher(rules_key):
+    return LocationMatcher([{'group': g, 'prefix': p, 'aliases': a} for g, p, a in rules_key])
+
+
+def get_location_matcher(rules=None):
+    """Return the compiled matcher for `rules` (defaults to the configured table)."""
+    if rules is None:
+        rules = current_app.config.get('TOOLS', {}).get('id_checker', {}).get('location_rules') or DEFAULT_LOCATION_RULES
+    return _compiled_matcher(tuple((r['group'], r['prefix'], tuple(r['aliases'])) for r in rules))
+
+
+def _clean_str(series):
+    """Vectorized `str(v).strip()` with missing values mapped to ''."""
+    return series.astype(object).where(series.notna(), '').astype(str).str.strip()
+
+
+def _analyze_chunk(df, results, matcher):
+    """Fold one roster chunk into the per-group max ID / count / latest DOJ."""
+    # ensure sufficient columns (we expect at least up to column S)
+    if df.shape[1] <= ROSTER_LOC_COL:
+        df = df.reindex(columns=range(ROSTER_LOC_COL + 1))
+
+    emp = _clean_str(df[ROSTER_EMP_COL])
+    loc = _clean_str(df[ROSTER_LOC_COL]).str.lower()
+    valid = (emp != '') & (loc != '')
+
+    # map location text to a group (first matching rule wins)
+    group = matcher.classify(loc).where(valid)
+
+    digits = emp.str.replace(r'\D', '', regex=True)
+    doj = pd.to_datetime(df[ROSTER_DOJ_COL], errors='coerce', format='mixed')
+
+    for key, prefix in matcher.groups.items():
+        # try to parse numeric portion and track max
+        matched = (group == key) & digits.str.startswith(prefix)
+        if not matched.any():
+            continue
+        tails = digits[matched].str[len(prefix):]
+        long_tails = tails.str.len() > INT64_SAFE_DIGITS
+        values = pd.to_numeric(tails[~long_tails].replace('', '0'), errors='coerce').dropna()
+        rec = results[key]
+        rec['found_count'] += len(values) + int(long_tails.sum())
+        candidates = [int(values.max())] if len(values) else []
+        candidates.extend(int(t) for t in tails[long_tails])
+        if candidates:
+            chunk_max = max(candidates)
+            if rec['max_found'] is None or chunk_max > rec['max_found']:
+                rec['max_found'] = chunk_max
+
+        # keep the most recent DOJ per group (column F)
+        chunk_doj = doj[matched].max()
+        if not pd.isna(chunk_doj) and (rec['last_doj'] is None or chunk_doj > rec['last_doj']):
+            rec['last_doj'] = chunk_doj
+
+
+def analyze_roster(chunks, matcher=None):
+    """Return last/next Employee ID and latest DOJ per location group for roster chunks."""
+    matcher = matcher or get_location_matcher()
+    # initialize results for groups
+    results = {k: {'prefix': p, 'max_found': None, 'found_count': 0, 'next_id': None, 'last_doj': None}
+               for k, p in matcher.groups.items()}
+
+    for df in chunks:
+        _analyze_chunk(df, results, matcher)
+
+    # compute next ids with padding and last_id full string
+    for k, rec in results.items():
+        if rec['max_found'] is None:
+            next_val = 1
+            suffix_len = 6
+            rec['last_id'] = None
+        else:
+            next_val = rec['max_found'] + 1
+            suffix_len = max(len(str(rec['max_found'])), 6)
+            rec['last_id'] = rec['prefix'] + str(rec['max_found']).zfill(suffix_len)
+        rec['next_id'] = rec['prefix'] + str(next_val).zfill(suffix_len)
+
+    # prepare clean results, include last_doj as ISO date string if available
+    clean_results = {}
+    for k, rec in results.items():
+        last_doj = None
+        if rec.get('last_doj') is not None:
+            try:
+                last_doj = rec['last_doj'].strftime('%Y-%m-%d')
+            except Exception:
+                last_doj = str(rec['last_doj'])
+        clean_results[k] = {
+            'last_id': rec.get('last_id'),
+            'next_id': rec.get('next_id'),
+            'last_doj': last_doj
+        }
+    return clean_results
+
+
+class AnalysisCache:
+    """Content-addressed cache of roster analysis results.
+
+    An in-memory LRU per worker in front of an optional directory of JSON
+    files shared by all workers. The directory is pruned on write to at most
+    `max_disk_entries` files (least recently used first) no older than
+    `max_age` seconds.
+    """
+
+    def __init__(self, max_entries=32, directory=None, max_disk_entries=512, max_age=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self.directory:
+            try:
+                with open(self._disk_path(key), encoding='utf-8') as f:
+                    value = json.load(f)
+                os.utime(self._disk_path(key))  # mtime doubles as last use for pruning
+            except (OSError, ValueError):
+                return None
+            self._remember(key, value)
+            return value
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = f'{self._disk_path(key)}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(value, f)
+                os.replace(tmp_path, self._disk_path(key))
+                self._prune_disk()
+            except OSError:
+                pass
+
+    def _prune_disk(self):
+        entries = []
+        cutoff = time.time() - self.max_age
+        for entry in os.scandir(self.directory):
+            try:
+                mtime = entry.stat().st_mtime
+                if mtime < cutoff:
+                    os.remove(entry.path)  # also sweeps .tmp files left by crashed writers
+                elif entry.name.endswith('.json'):
+                    entries.append((mtime, entry.path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_analysis_cache = None
+
+
+def get_analysis_cache():
+    global _analysis_cache
+    if _analysis_cache is None:
+        settings = current_app.config.get('TOOLS', {}).get('id_checker', {})
+        directory = settings.get('analysis_cache_dir')
+        if directory and not os.path.isabs(directory):
+            directory = os.path.join(current_app.root_path, directory)
+        _analysis_cache = AnalysisCache(settings.get('analysis_cache_size', 32), directory,
+                                        settings.get('analysis_cache_disk_entries', 512),
+                                        settings.get('analysis_cache_max_age', 7 * 24 * 3600))
+    return _analysis_cache
+
+
+def _stream_digest(stream, block_size=1024 * 1024):
+    """SHA-256 of a seekable stream, leaving it rewound."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(block_size), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _analysis_key(content_id, matcher):
+    # the rule table is part of the key so config changes never serve stale groups
+    rules = repr(sorted(matcher.groups.items())) + matcher.regex.pattern
+    return hashlib.sha256(f'{content_id}|{rules}'.encode()).hexdigest()
 
 
 @id_checker_bp.route('/analyze', methods=['POST'])
 def analyze_file():
     """Analyze uploaded Excel file or server path and return next available IDs per location."""
     try:
+        cache = get_analysis_cache()
+        matcher = get_location_matcher()
+
         # accept uploaded file
         if 'file' in request.files and request.files['file'].filename:
             file = request.files['file']
             filename = (file.filename or '').lower()
-            # read into bytes buffer for possible zip handling
-            buf = BytesIO(file.read())
-            buf.seek(0)
-            # handle zip containing xlsx
-            if zipfile.is_zipfile(buf) or filename.endswith('.zip'):
-                z = zipfile.ZipFile(buf)
-                # find first xlsx/xls file
-                target_name = None
-                for name in z.namelist():
-                    if name.lower().endswith('.xlsx') or name.lower().endswith('.xls'):
-                        target_name = name
-                        break
-                if not target_name:
-                    return jsonify({'success': False, 'error': 'No Excel file found in ZIP'}), 400
-                with z.open(target_name) as f:
-                    data = f.read()
-                    df = pd.read_excel(BytesIO(data), header=None, skiprows=3, engine='openpyxl')
-            else:
-                buf.seek(0)
-                df = pd.read_excel(buf, header=None, skiprows=3, engine='openpyxl')
+            # Werkzeug spools large uploads to disk; read from that stream directly
+            workbook = file.stream
+            cache_key = _analysis_key('sha256:' + _stream_digest(workbook), matcher)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return _analysis_response(cached, hit=True)
+            # handle zip containing xlsx (an .xlsx is itself a zip, so look inside first)
+            if zipfile.is_zipfile(workbook) or filename.endswith('.zip'):
+                workbook.seek(0)
+                z = zipfile.ZipFile(workbook)
+                if 'xl/workbook.xml' not in z.namelist():
+                    # find first xlsx/xls file
+                    target_name = None
+                    for name in z.namelist():
+                        if name.lower().endswith('.xlsx') or name.lower().endswith('.xls'):
+                            target_name = name
+                            break
+                    if not target_name:
+                        return jsonify({'success': False, 'error': 'No Excel file found in ZIP'}), 400
+                    # extract to a disk-backed temp file; openpyxl needs a seekable stream
+                    workbook = tempfile.TemporaryFile()
+                    with z.open(target_name) as f:
+                        shutil.copyfileobj(f, workbook)
+            workbook.seek(0)
+            source = workbook
         else:
             server_path = request.form.get('server_path')
             if not server_path or not os.path.exists(server_path):
                 return jsonify({'success': False, 'error': 'No file uploaded and server_path missing or not found'}), 400
-            df = pd.read_excel(server_path, header=None, skiprows=3, engine='openpyxl')
-
-        # ensure sufficient columns (we expect at least up to column S)
-        if df.shape[1] <= 18:
-            df = df.reindex(columns=range(19))
-
-        emp_col = 0
-        loc_col = 18
-        doj_col = 5
-
-        # group Bangalore + Shillong together in results (both use prefix 010)
-        GROUPS = {
-            'bangalore_shillong': '010',
-            'hyderabad': '030'
-        }
-
-        # initialize results for groups
-        results = {k: {'prefix': GROUPS[k], 'max_found': None, 'found_count': 0, 'next_id': None, 'last_doj': None} for k in GROUPS}
+            # a server file is identified by path + mtime + size; no need to read it
+            st = os.stat(server_path)
+            cache_key = _analysis_key(f'path:{os.path.abspath(server_path)}:{st.st_mtime_ns}:{st.st_size}', matcher)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return _analysis_response(cached, hit=True)
+            source = server_path
 
-        for _, row in df.iterrows():
-            empv = _safe_str(row[emp_col])
-            locv = _safe_str(row[loc_col]).lower()
-            if not empv or not locv:
-                continue
-
-            # map location text to a group
-            if 'bangalore' in locv or 'blr' in locv or 'bengaluru' in locv or 'shillong' in locv:
-                group_key = 'bangalore_shillong'
-            elif 'hyderabad' in locv or 'hyd' in locv:
-                group_key = 'hyderabad'
-            else:
-                continue
-
-            prefix = GROUPS[group_key]
-            digits = ''.join(ch for ch in empv if ch.isdigit())
-            if not digits:
-                continue
+        # stream the sheet in bounded chunks (openpyxl read-only mode)
+        chunks = spreadsheet_reader.iter_chunks(source, '.xlsx', header=None, skiprows=3)
 
-            # try to parse numeric portion and track max
-            if digits.startswith(prefix):
-                suffix = digits[len(prefix):]
-                try:
-                    val = int(suffix) if suffix != '' else 0
-                except Exception:
-                    continue
-                rec = results[group_key]
-                rec['found_count'] += 1
-                if rec['max_found'] is None or val > rec['max_found']:
-                    rec['max_found'] = val
-
-            # capture DOJ from column F (doj_col)
-            try:
-                raw = row[doj_col]
-                dt = pd.to_datetime(raw, errors='coerce')
-                if not pd.isna(dt):
-                    # keep the most recent DOJ per group
-                    if rec.get('last_doj') is None or dt > rec.get('last_doj'):
-                        rec['last_doj'] = dt
-            except Exception:
-                pass
+        clean_results = analyze_roster(chunks, matcher)
+        cache.put(cache_key, clean_results)
 
-        # compute next ids with padding and last_id full string
-        for k, rec in results.items():
-            if rec['max_found'] is None:
-                next_val = 1
-                suffix_len = 6
-                rec['last_id'] = None
-            else:
-                next_val = rec['max_found'] + 1
-                suffix_len = max(len(str(rec['max_found'])), 6)
-                rec['last_id'] = rec['prefix'] + str(rec['max_found']).zfill(suffix_len)
-            rec['next_id'] = rec['prefix'] + str(next_val).zfill(suffix_len)
-
-        # prepare clean results, include last_doj as ISO date string if available
-        clean_results = {}
-        for k, rec in results.items():
-            last_doj = None
-            if rec.get('last_doj') is not None:
-                try:
-                    last_doj = rec['last_doj'].strftime('%Y-%m-%d')
-                except Exception:
-                    last_doj = str(rec['last_doj'])
-            clean_results[k] = {
-                'last_id': rec.get('last_id'),
-                'next_id': rec.get('next_id'),
-                'last_doj': last_doj
-            }
-
-        return jsonify({'success': True, 'results': clean_results})
+        return _analysis_response(clean_results, hit=False)
 
     except Exception as e:
         current_app.logger.exception('Error analyzing file')
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def _analysis_response(results, hit):
+    response = jsonify({'success': True, 'results': results})
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
@@ -0,0 +1,508 @@
+"""
+Employee ID Registry
+
+Durable store of used and reserved Employee IDs for the ID checker. IDs live
+in a SQLite database (the one named by `SQLALCHEMY_DATABASE_URI`) opened in
+WAL mode, so every gunicorn worker sees the same registry and writes from
+different workers serialize on the database lock instead of racing.
+
+Each ID is split into a prefix and a zero-padded number (`EMP0007` ->
+`EMP`, 7, width 4; `010123456` -> `010`, 123456, width 6) and indexed on
+(prefix, width, number). A small `id_prefixes` table keeps the per-prefix
+used/reserved counts and highest number, updated in the same transaction as
+the IDs, so next-ID and statistics queries never scan the registry.
+
+Occupied numbers are also kept as maximal runs in `id_runs`, keyed by a
+split that does not depend on configuration: everything before the trailing
+digits, and the full digit tail (`010123456` -> '', 10123456, width 9). A
+configured prefix maps onto it as an offset range, so runs stay valid when
+prefixes are added and overlapping prefixes (`010`, `0101`) see each other's
+IDs. Free IDs are the gaps between runs, so handing out N free IDs costs one
+indexed seek plus a walk over at most N + 1 runs, however densely the range
+is occupied.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+USED = 'used'
+RESERVED = 'reserved'
+BUSY_TIMEOUT_MS = 5000
+_QUERY_CHUNK = 500  # stays below SQLite's bound-parameter limit
+
+SCHEMA_VERSION = 4
+DEFAULT_WIDTH = 4
+MAX_NUMBER = 2 ** 63 - 1  # SQLite INTEGER; longer digit tails are kept as plain strings
+
+_SPLIT_RE = re.compile(r'^(\D*)(\d+)$')
+_TAIL_RE = re.compile(r'^(.*?)(\d*)$', re.S)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS id_registry (
+    id TEXT PRIMARY KEY,
+    prefix TEXT NOT NULL,
+    number INTEGER,
+    width INTEGER,
+    status TEXT NOT NULL,
+    employee_name TEXT,
+    department TEXT,
+    actor TEXT,
+    reason TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS id_registry_number ON id_registry (prefix, width, number);
+CREATE TABLE IF NOT EXISTS id_runs (
+    prefix TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    run_start INTEGER NOT NULL,
+    run_end INTEGER NOT NULL,
+    PRIMARY KEY (prefix, width, run_start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS id_audit (
+    batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    action TEXT NOT NULL,
+    actor TEXT,
+    reason TEXT,
+    requested INTEGER NOT NULL,
+    succeeded INTEGER NOT NULL,
+    ids TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    outcome TEXT NOT NULL DEFAULT 'committed'
+);
+CREATE TABLE IF NOT EXISTS id_prefixes (
+    prefix TEXT PRIMARY KEY,
+    used_count INTEGER NOT NULL DEFAULT 0,
+    reserved_count INTEGER NOT NULL DEFAULT 0,
+    max_number INTEGER,
+    max_used INTEGER
+);
+CREATE TABLE IF NOT EXISTS id_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class IdConflict(ValueError):
+    """Raised when an ID cannot move to the requested status."""
+
+
+class BatchConflict(IdConflict):
+    """Raised when an atomic batch is rolled back; carries the per-ID results."""
+
+    def __init__(self, results):
+        super().__init__('Batch rolled back: some IDs are unavailable')
+        self.results = results
+        self.batch_id = None  # audit record of the rejected batch
+
+
+def database_path(uri, root_path):
+    """Filesystem path for a `sqlite:///...` URI, relative paths under `root_path`.
+
+    Returns ':memory:' for in-memory URIs and None for non-SQLite databases.
+    """
+    if not uri or not uri.startswith('sqlite:'):
+        return None
+    path = uri.split(':///', 1)[1] if ':///' in uri else ''
+    if not path or path == ':memory:':
+        return ':memory:'
+    return path if os.path.isabs(path) else os.path.join(root_path, path)
+
+
+def pattern_prefix(pattern):
+    """Prefix of an ID pattern such as 'EMP####'."""
+    return pattern.rstrip('#')
+
+
+def run_key(emp_id):
+    """Configuration-independent (head, width, number) of an ID for `id_runs`.
+
+    head is everything before the trailing digits; number is None without
+    digits or beyond MAX_NUMBER.
+    """
+    head, digits = _TAIL_RE.match(emp_id).groups()
+    if not digits or int(digits) > MAX_NUMBER:
+        return emp_id, None, None
+    return head, len(digits), int(digits)
+
+
+def _prefix_range(prefix, width):
+    """(head, run width, offset) under which `prefix` + `width`-digit numbers are kept in `id_runs`."""
+    head, digits = _TAIL_RE.match(prefix).groups()
+    return head, len(digits) + width, int(digits) * 10 ** width if digits else 0
+
+
+class IdRegistry:
+    """SQLite-backed registry of used/reserved IDs, safe across threads and processes."""
+
+    def __init__(self, path, prefixes=()):
+        self.path = path
+        # Longest first so '0101' wins over '010' when both are configured
+        self.prefixes = sorted({p for p in prefixes if p}, key=len, reverse=True)
+        self._local = threading.local()
+        self._memory_anchor = None
+        if path == ':memory:':
+            # A named shared-cache database lives as long as one connection to it is open
+            self._uri = f'file:id_registry_{id(self)}?mode=memory&cache=shared'
+            self._memory_anchor = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._uri = None
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+
+    # -------------------- connections --------------------
+    def _connect(self):
+        if self._uri:
+            conn = sqlite3.connect(self._uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000,
+                                   isolation_level=None)
+        else:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return conn
+
+    @property
+    def conn(self):
+        # One connection per thread (and per forked worker, since it is created lazily)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock up front."""
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _migrate(self):
+        """Bring derived tables in line with the schema and the configured prefixes.
+
+        The (prefix, number, width) split depends on the configured prefixes,
+        so when they change (e.g. a longer site prefix is added) every ID is
+        split again and the runs and per-prefix counters are rebuilt from it.
+        """
+        prefix_set = json.dumps(sorted(self.prefixes))
+        with self.transaction() as conn:
+            if 'outcome' not in {row[1] for row in conn.execute('PRAGMA table_info(id_audit)')}:
+                conn.execute("ALTER TABLE id_audit ADD COLUMN outcome TEXT NOT NULL DEFAULT 'committed'")
+            if 'max_used' not in {row[1] for row in conn.execute('PRAGMA table_info(id_prefixes)')}:
+                conn.execute('ALTER TABLE id_prefixes ADD COLUMN max_used INTEGER')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            stored = conn.execute("SELECT value FROM id_meta WHERE key = 'prefixes'").fetchone()
+            if version >= SCHEMA_VERSION and stored and stored[0] == prefix_set:
+                return
+            changed = []
+            for emp_id, prefix, number, width in conn.execute(
+                    'SELECT id, prefix, number, width FROM id_registry').fetchall():
+                split = self.split(emp_id)
+                if split != (prefix, number, width):
+                    changed.append(split + (emp_id,))
+            conn.executemany('UPDATE id_registry SET prefix = ?, number = ?, width = ? WHERE id = ?', changed)
+            conn.execute('DELETE FROM id_prefixes')
+            conn.execute(
+                'INSERT INTO id_prefixes (prefix, used_count, reserved_count, max_number, max_used) '
+                'SELECT prefix, SUM(status = ?), SUM(status = ?), MAX(number), '
+                'MAX(CASE WHEN status = ? THEN number END) FROM id_registry GROUP BY prefix',
+                (USED, RESERVED, USED))
+            conn.execute('DELETE FROM id_runs')
+            keys = sorted(key for key in map(run_key, (r[0] for r in conn.execute('SELECT id FROM id_registry')))
+                          if key[2] is not None)
+            runs = []
+            for head, width, number in keys:
+                last = runs[-1] if runs else None
+                if last and last[:2] == [head, width] and last[3] >= number - 1:
+                    last[3] = max(last[3], number)
+                else:
+                    runs.append([head, width, number, number])
+            conn.executemany('INSERT INTO id_runs (prefix, width, run_start, run_end) VALUES (?, ?, ?, ?)', runs)
+            conn.execute("INSERT OR REPLACE INTO id_meta (key, value) VALUES ('prefixes', ?)", (prefix_set,))
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    # -------------------- parsing --------------------
+    def split(self, emp_id):
+        """Return (prefix, number, width) for an ID.
+
+        number is None without a numeric tail or when the tail does not fit
+        in MAX_NUMBER.
+        """
+        for prefix in self.prefixes:
+            rest = emp_id[len(prefix):]
+            if emp_id.startswith(prefix) and rest.isdigit() and int(rest) <= MAX_NUMBER:
+                return prefix, int(rest), len(rest)
+        match = _SPLIT_RE.match(emp_id)
+        if match and int(match.group(2)) <= MAX_NUMBER:
+            return match.group(1), int(match.group(2)), len(match.group(2))
+        return emp_id, None, None
+
+    # -------------------- queries --------------------
+    def statuses(self, ids):
+        """Map each registered ID in `ids` to 'used' or 'reserved'."""
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        for i in range(0, len(ids), _QUERY_CHUNK):
+            chunk = ids[i:i + _QUERY_CHUNK]
+            rows = self.conn.execute(
+                f'SELECT id, status FROM id_registry WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+            found.update(rows)
+        return found
+
+    def occupied(self, ids):
+        """Boolean array, True where `ids[i]` is registered (used or reserved).
+
+        IDs are grouped by run key (see run_key) and their numbers tested in one
+        vectorized searchsorted against that group's occupied runs, so a batch
+        costs one range query per group rather than one lookup per ID.
+        """
+        conn = self.conn
+        mask = np.zeros(len(ids), dtype=bool)
+        groups, other = {}, []
+        for i, emp_id in enumerate(ids):
+            prefix, width, number = run_key(emp_id)
+            if number is None:
+                other.append(i)
+            else:
+                positions, numbers = groups.setdefault((prefix, width), ([], []))
+                positions.append(i)
+                numbers.append(number)
+
+        for (prefix, width), (positions, numbers) in groups.items():
+            numbers = np.asarray(numbers, dtype=np.int64)
+            lo, hi = int(numbers.min()), int(numbers.max())
+            first = conn.execute(
+                'SELECT run_start FROM id_runs WHERE prefix = ? AND width = ? AND run_start <= ? '
+                'ORDER BY run_start DESC LIMIT 1', (prefix, width, lo)).fetchone()
+            runs = conn.execute(
+                'SELECT run_start, run_end FROM id_runs WHERE prefix = ? AND width = ? '
+                'AND run_start BETWEEN ? AND ? ORDER BY run_start',
+                (prefix, width, first[0] if first else lo, hi)).fetchall()
+            if not runs:
+                continue
+            runs = np.asarray(runs, dtype=np.int64)
+            idx = np.searchsorted(runs[:, 0], numbers, side='right') - 1
+            mask[positions] = (idx >= 0) & (numbers <= runs[np.maximum(idx, 0), 1])
+
+        if other:
+            found = self.statuses([ids[i] for i in other])
+            mask[other] = [ids[i] in found for i in other]
+        return mask
+
+    def max_number(self, prefix):
+        """Highest registered (used or reserved) number for `prefix`, if any."""
+        row = self.conn.execute('SELECT max_number FROM id_prefixes WHERE prefix = ?', (prefix,)).fetchone()
+        return row[0] if row else None
+
+    def max_used(self, prefix):
+        """Highest used number for `prefix`, if any; reservations are ignored."""
+        row = self.conn.execute('SELECT max_used FROM id_prefixes WHERE prefix = ?', (prefix,)).fetchone()
+        return row[0] if row else None
+
+    def default_width(self, prefix):
+        """Digit width holding most of the registered IDs for `prefix`, if any."""
+        row = self.conn.execute(
+            'SELECT width FROM id_registry WHERE prefix = ? AND width IS NOT NULL GROUP BY width '
+            'ORDER BY COUNT(*) DESC LIMIT 1', (prefix,)).fetchone()
+        return row[0] if row else None
+
+    def free_numbers(self, prefix, width, start, count):
+        """Up to `count` unregistered numbers >= `start` for IDs of `width` digits.
+
+        Fewer are returned only when the width's number space is exhausted.
+        """
+        conn = self.conn
+        head, run_width, offset = _prefix_range(prefix, width)
+        last = min(offset + 10 ** width - 1, MAX_NUMBER)
+        numbers = []
+        n = offset + max(start, 0)
+        if n > last:
+            return numbers
+        row = conn.execute(
+            'SELECT run_end FROM id_runs WHERE prefix = ? AND width = ? AND run_start <= ? '
+            'ORDER BY run_start DESC LIMIT 1', (head, run_width, n)).fetchone()
+        if row and row[0] >= n:
+            n = row[0] + 1
+        runs = conn.execute(
+            'SELECT run_start, run_end FROM id_runs WHERE prefix = ? AND width = ? AND run_start > ? '
+            'ORDER BY run_start', (head, run_width, n))
+        try:
+            for run_start, run_end in runs:
+                # the gap before this run is free
+                stop = min(run_start, n + count - len(numbers), last + 1)
+                numbers.extend(range(n, stop))
+                n = run_end + 1
+                if len(numbers) >= count or n > last:
+                    break
+            else:
+                numbers.extend(range(n, min(n + count - len(numbers), last + 1)))
+        finally:
+            runs.close()
+        return [number - offset for number in numbers]
+
+    def stats(self):
+        """Totals plus per-prefix used/reserved counts, read from the prefix table."""
+        rows = self.conn.execute(
+            'SELECT prefix, used_count, reserved_count, max_number FROM id_prefixes ORDER BY prefix').fetchall()
+        return {
+            'total_used': sum(r[1] for r in rows),
+            'total_reserved': sum(r[2] for r in rows),
+            'prefixes': {r[0]: {'used': r[1], 'reserved': r[2], 'max_number': r[3]} for r in rows},
+        }
+
+    # -------------------- writes --------------------
+    def _bump(self, conn, prefix, number, used=0, reserved=0):
+        conn.execute(
+            'INSERT INTO id_prefixes (prefix, used_count, reserved_count, max_number, max_used) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(prefix) DO UPDATE SET '
+            'used_count = used_count + excluded.used_count, '
+            'reserved_count = reserved_count + excluded.reserved_count, '
+            'max_number = CASE WHEN max_number IS NULL OR excluded.max_number > max_number '
+            'THEN excluded.max_number ELSE max_number END, '
+            'max_used = CASE WHEN max_used IS NULL OR excluded.max_used > max_used '
+            'THEN excluded.max_used ELSE max_used END',
+            (prefix, used, reserved, number, number if used > 0 else None))
+
+    def _occupy(self, conn, prefix, width, number):
+        """Add `number` to the runs of (prefix, width), merging with neighbours."""
+        if number is None:
+            return
+        before = conn.execute(
+            'SELECT run_start, run_end FROM id_runs WHERE prefix = ? AND width = ? AND run_start <= ? '
+            'ORDER BY run_start DESC LIMIT 1', (prefix, width, number)).fetchone()
+        if before and before[1] >= number:
+            return
+        after = conn.execute(
+            'SELECT run_end FROM id_runs WHERE prefix = ? AND width = ? AND run_start = ?',
+            (prefix, width, number + 1)).fetchone()
+        run_end = number
+        if after:
+            run_end = after[0]
+            conn.execute('DELETE FROM id_runs WHERE prefix = ? AND width = ? AND run_start = ?',
+                         (prefix, width, number + 1))
+        if before and before[1] == number - 1:
+            conn.execute('UPDATE id_runs SET run_end = ? WHERE prefix = ? AND width = ? AND run_start = ?',
+                         (run_end, prefix, width, before[0]))
+        else:
+            conn.execute('INSERT INTO id_runs (prefix, width, run_start, run_end) VALUES (?, ?, ?, ?)',
+                         (prefix, width, number, run_end))
+
+    def _insert(self, conn, emp_id, status, **fields):
+        prefix, number, width = self.split(emp_id)
+        conn.execute(
+            'INSERT INTO id_registry (id, prefix, number, width, status, employee_name, department, '
+            'actor, reason, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (emp_id, prefix, number, width, status, fields.get('employee_name'), fields.get('department'),
+             fields.get('actor'), fields.get('reason'), time.time()))
+        self._bump(conn, prefix, number, used=int(status == USED), reserved=int(status == RESERVED))
+        self._occupy(conn, *run_key(emp_id))
+
+    def _reserve(self, conn, emp_id, reason=None, actor=None):
+        row = conn.execute('SELECT status FROM id_registry WHERE id = ?', (emp_id,)).fetchone()
+        if row:
+            raise IdConflict('ID is already in use' if row[0] == USED else 'ID is already reserved')
+        self._insert(conn, emp_id, RESERVED, reason=reason, actor=actor)
+
+    def _allocate(self, conn, emp_id, employee_name=None, department=None, actor=None):
+        row = conn.execute('SELECT status, prefix, number FROM id_registry WHERE id = ?', (emp_id,)).fetchone()
+        if row and row[0] == USED:
+            raise IdConflict('ID is already allocated')
+        if row:
+            # a reserved ID is handed out: move it from reserved to used
+            conn.execute(
+                'UPDATE id_registry SET status = ?, employee_name = ?, department = ?, actor = ?, '
+                'updated_at = ? WHERE id = ?',
+                (USED, employee_name, department, actor, time.time(), emp_id))
+            self._bump(conn, row[1], row[2], used=1, reserved=-1)
+        else:
+            self._insert(conn, emp_id, USED, employee_name=employee_name, department=department, actor=actor)
+
+    def reserve(self, emp_id, reason=None, actor=None):
+        """Reserve an unregistered ID; raises IdConflict if it is used or reserved."""
+        with self.transaction() as conn:
+            self._reserve(conn, emp_id, reason, actor)
+
+    def allocate(self, emp_id, employee_name=None, department=None, actor=None):
+        """Mark an ID as used (taking over a reservation); raises IdConflict if already used."""
+        with self.transaction() as conn:
+            self._allocate(conn, emp_id, employee_name, department, actor)
+
+    def seed_reserved(self, ids, reason='Configured reservation'):
+        """Reserve configured IDs that are not registered yet."""
+        with self.transaction() as conn:
+            for emp_id in ids:
+                if not conn.execute('SELECT 1 FROM id_registry WHERE id = ?', (emp_id,)).fetchone():
+                    self._insert(conn, emp_id, RESERVED, reason=reason, actor='config')
+
+    def bulk(self, action, ids=None, count=None, prefix=None, width=DEFAULT_WIDTH, start=1,
+             actor=None, reason=None, employee_name=None, department=None, atomic=False):
+        """Reserve or allocate a batch of IDs in one transaction.
+
+        Either `ids` is given, or `count` free IDs of `prefix`/`width` are picked
+        from `start` inside the same transaction. Returns (results, batch_id)
+        with one {'id', 'success', 'error'?} result per ID; one audit row is
+        written per batch. With `atomic`, any conflict rolls the batch back and
+        raises BatchConflict; the rejected batch is still audited.
+        """
+        if action not in ('reserve', 'allocate'):
+            raise ValueError(f'Unknown bulk action: {action}')
+        results = []
+        try:
+            with self.transaction() as conn:
+                if ids is None:
+                    ids = [f'{prefix}{n:0{width}d}' for n in self.free_numbers(prefix, width, start, count)]
+                for emp_id in ids:
+                    try:
+                        if action == 'reserve':
+                            self._reserve(conn, emp_id, reason, actor)
+                        else:
+                            self._allocate(conn, emp_id, employee_name, department, actor)
+                    except IdConflict as e:
+                        results.append({'id': emp_id, 'success': False, 'error': str(e)})
+                    else:
+                        results.append({'id': emp_id, 'success': True})
+                failed = [r for r in results if not r['success']]
+                if atomic and failed:
+                    raise BatchConflict(results)
+                done = [r['id'] for r in results if r['success']]
+                batch_id = self._audit(conn, action, actor, reason, len(results), done)
+        except BatchConflict as e:
+            with self.transaction() as conn:
+                e.batch_id = self._audit(conn, action, actor, reason, len(results),
+                                         [r['id'] for r in results], outcome='rolled_back')
+            raise
+        return results, batch_id
+
+    def _audit(self, conn, action, actor, reason, requested, ids, outcome='committed'):
+        cursor = conn.execute(
+            'INSERT INTO id_audit (action, actor, reason, requested, succeeded, ids, created_at, outcome) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (action, actor, reason, requested, len(ids) if outcome == 'committed' else 0,
+             json.dumps(ids), time.time(), outcome))
+        return cursor.lastrowid
+
+    def audit_log(self, limit=50):
+        """Most recent batch audit records, newest first.
+
+        `ids` lists the IDs written, or for a rolled-back batch the IDs requested.
+        """
+        rows = self.conn.execute(
+            'SELECT batch_id, action, actor, reason, requested, succeeded, ids, created_at, outcome '
+            'FROM id_audit ORDER BY batch_id DESC LIMIT ?', (limit,))
+        keys = ('batch_id', 'action', 'actor', 'reason', 'requested', 'succeeded', 'ids', 'created_at', 'outcome')
+        return [dict(zip(keys, row[:6] + (json.loads(row[6]),) + row[7:])) for row in rows]
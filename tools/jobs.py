@@ -0,0 +1,159 @@
+"""
+Background Jobs
+
+Minimal job runner for work that is too slow for a request thread (large
+uploads, bulk processing). Jobs run on a local thread pool; their state is
+kept as small JSON files so that whichever gunicorn worker receives the
+status request can report progress.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+JOB_MAX_AGE = 24 * 3600  # job files older than this are pruned
+JOB_HEARTBEAT_SECONDS = 10  # active job files are touched this often by their worker
+JOB_STALE_AFTER = 60  # an active job not touched for this long lost its worker
+ACTIVE_STATUSES = ('queued', 'running')
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """Handle passed to a job function for reporting progress."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.id = job_id
+
+    def progress(self, **fields):
+        self.store.update(self.id, **fields)
+
+
+class JobStore:
+    """File-backed job registry with a lazily created worker pool."""
+
+    def __init__(self, directory, max_workers=2):
+        self.directory = directory
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._active = set()
+
+    @property
+    def executor(self):
+        # Created on first use so the pool belongs to the forked worker, not the master
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='job')
+                threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True).start()
+            return self._executor
+
+    def _heartbeat(self):
+        """Keep the files of this process's active jobs fresh (see JOB_STALE_AFTER)."""
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                active = list(self._active)
+            for job_id in active:
+                try:
+                    os.utime(self._path(job_id))
+                except OSError:
+                    pass
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _write(self, job_id, state):
+        tmp_path = f'{self._path(job_id)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(job_id))
+
+    def create(self, kind, **fields):
+        """Register a queued job and return its ID."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.prune()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        state = {'id': job_id, 'kind': kind, 'status': 'queued',
+                 'created_at': now, 'updated_at': now}
+        state.update(fields)
+        self._write(job_id, state)
+        return job_id
+
+    def get(self, job_id):
+        """Return the job state dict, or None for unknown/invalid IDs.
+
+        A queued or running job whose file has not been touched for
+        JOB_STALE_AFTER seconds lost its worker (crash, restart) and is
+        reported, and stored, as failed.
+        """
+        if not job_id or not JOB_ID_RE.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                state = json.load(f)
+            touched = os.path.getmtime(self._path(job_id))
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get('status') in ACTIVE_STATUSES and time.time() - touched > JOB_STALE_AFTER:
+            state.update(status='failed', error='Job was interrupted; please try again',
+                         finished_at=time.time())
+            self._write(job_id, state)
+        return state
+
+    def update(self, job_id, **fields):
+        # Only the thread running the job writes its state, so read-modify-write is safe
+        state = self.get(job_id) or {'id': job_id}
+        state.update(fields)
+        state['updated_at'] = time.time()
+        self._write(job_id, state)
+        return state
+
+    def submit(self, job_id, fn, *args, **kwargs):
+        """Run `fn(job, *args, **kwargs)` in the background.
+
+        The return value (a dict) is stored as the job `result`; an exception
+        marks the job as failed with its message.
+        """
+        def _run():
+            job = Job(self, job_id)
+            self.update(job_id, status='running', started_at=time.time())
+            try:
+                result = fn(job, *args, **kwargs)
+            except Exception as e:
+                logger.exception('Job %s failed', job_id)
+                self.update(job_id, status='failed', error=str(e), finished_at=time.time())
+            else:
+                self.update(job_id, status='done', result=result, finished_at=time.time())
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+
+        executor = self.executor
+        with self._lock:
+            self._active.add(job_id)
+        return executor.submit(_run)
+
+    def prune(self, max_age=JOB_MAX_AGE):
+        """Remove job files older than `max_age` seconds."""
+        cutoff = time.time() - max_age
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
@@ -11,20 +11,29 @@ Features:
 - Batch processing capabilities
 """
 
+import io
+import json
+import logging
+import multiprocessing
 import os
+import shutil
 import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+from itertools import chain
+from flask import Blueprint, Response, render_template, request, jsonify, send_file, current_app
 from werkzeug.utils import secure_filename
+from tools import zipstream
 from PyPDF2 import PdfReader, PdfWriter, PdfMerger
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.colors import grey
 import fitz  # PyMuPDF for PDF to image conversion
 from PIL import Image
 import zipfile
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 pdf_toolkit_bp = Blueprint('pdf_toolkit', __name__,
                          template_folder='templates',
                          url_prefix='/pdf-toolkit')
@@ -33,41 +42,178 @@ def allowed_file(filename):
     """Check if the file has an allowed extension."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
-def compress_pdf(input_path, output_path, quality=0.8):
+# Embedded images above this resolution are downsampled when optimizing
+COMPRESS_TARGET_DPI = 150
+# Only downsample when the image is meaningfully denser than the target
+DOWNSAMPLE_THRESHOLD = 1.2
+
+
+def _jpeg_quality(quality):
+    """Normalize the UI quality value (1-100) with the legacy default."""
+    q = int(float(quality))
+    if q <= 0:
+        q = 75
+    return min(q, 100)
+
+
+def _image_dpis(doc):
+    """Map each image xref to the highest effective DPI it is drawn at anywhere in `doc`."""
+    dpis = {}
+    for page in doc:
+        try:
+            infos = page.get_image_info(xrefs=True)
+        except Exception:
+            continue
+        for info in infos:
+            xref, drawn_width = info.get('xref'), info['bbox'][2] - info['bbox'][0]
+            if xref and drawn_width > 0:
+                dpis[xref] = max(dpis.get(xref, 0), info['width'] / (drawn_width / 72))
+    return dpis
+
+
+def _recompress_images(doc, quality, target_dpi):
+    """Downsample and JPEG-encode images drawn above `target_dpi`; returns (count, bytes_saved)."""
+    count, saved, seen = 0, 0, set()
+    dpis = _image_dpis(doc)
+    for page in doc:
+        for img in page.get_images(full=True):
+            xref, smask = img[0], img[1]
+            if xref in seen:
+                continue
+            seen.add(xref)
+            if smask:
+                continue  # transparency would be lost as JPEG
+
+            dpi = dpis.get(xref, 0)
+            if not dpi or dpi <= target_dpi * DOWNSAMPLE_THRESHOLD:
+                continue
+            try:
+                original_len = len(doc.xref_stream_raw(xref) or b'')
+                pix = fitz.Pixmap(doc, xref)
+                if pix.alpha:
+                    pix = fitz.Pixmap(pix, 0)
+                if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+                    pix = fitz.Pixmap(fitz.csRGB, pix)
+                scale = target_dpi / dpi
+                pix = fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)), None)
+
+                mode = 'L' if pix.n == 1 else 'RGB'
+                out = BytesIO()
+                Image.frombytes(mode, (pix.width, pix.height), pix.samples).save(
+                    out, 'JPEG', quality=quality, optimize=True)
+                data = out.getvalue()
+                if len(data) >= original_len:
+                    continue
+                page.replace_image(xref, stream=data)
+                count += 1
+                saved += original_len - len(data)
+            except Exception as e:
+                print(f"Image recompression skipped for xref {xref}: {e}")
+    return count, saved
+
+
+def _save_optimized(doc, output_path):
+    """Write with unused objects dropped, duplicates merged and streams deflated."""
+    options = dict(garbage=4, clean=True, deflate=True, deflate_images=True, deflate_fonts=True)
+    try:
+        doc.save(output_path, use_objstms=1, **options)
+    except TypeError:
+        # PyMuPDF builds without object-stream support
+        doc.save(output_path, **options)
+
+
+def optimize_pdf(input_path, output_path, quality=75, target_dpi=COMPRESS_TARGET_DPI):
+    """Compress a PDF in place of its structure: text, vectors and fonts are kept.
+
+    Stages: recompress/downsample embedded images drawn above `target_dpi`,
+    then save with garbage collection (unused objects and resources dropped,
+    identical objects and fonts merged), deflated streams and object streams.
+    Returns a report of bytes saved per stage; the original is copied through
+    if optimizing would not make the file smaller.
+    """
+    original_bytes = os.path.getsize(input_path)
+    doc = fitz.open(input_path)
+    try:
+        image_count, image_saved = _recompress_images(doc, _jpeg_quality(quality), target_dpi)
+        _save_optimized(doc, output_path)
+    finally:
+        doc.close()
+
+    output_bytes = os.path.getsize(output_path)
+    report = {
+        'original_bytes': original_bytes,
+        'stages': [
+            {'stage': 'images', 'images_recompressed': image_count, 'bytes_saved': image_saved},
+            {'stage': 'structure', 'bytes_saved': original_bytes - image_saved - output_bytes},
+        ],
+    }
+    if output_bytes >= original_bytes:
+        shutil.copyfile(input_path, output_path)
+        output_bytes = original_bytes
+        report['kept_original'] = True
+    report['output_bytes'] = output_bytes
+    report['bytes_saved'] = original_bytes - output_bytes
+    return report
+
+
+RASTERIZE_DPI = 150
+
+
+def _page_jpeg(pix, quality):
+    """JPEG bytes for a rendered page, encoded in memory."""
+    try:
+        return pix.tobytes('jpeg', jpg_quality=quality)
+    except (TypeError, ValueError):
+        # PyMuPDF builds without JPEG output: encode the raw samples with PIL
+        out = BytesIO()
+        mode = 'L' if pix.n == 1 else 'RGB'
+        Image.frombytes(mode, (pix.width, pix.height), pix.samples).save(out, 'JPEG', quality=quality, optimize=True)
+        return out.getvalue()
+
+
+def rasterize_pdf(input_path, output_path, quality=75, dpi=RASTERIZE_DPI):
     """Compress a PDF by rasterizing pages to images and re-encoding with lower JPEG quality.
 
     Note: This approach rasterizes PDF pages which may increase file size for text-heavy PDFs
     but effectively reduces size for image-rich PDFs. `quality` expected 1-100 (higher = better quality).
+    Pages are rendered, JPEG-encoded and inserted one at a time without touching
+    disk; only the current page's pixmap is held uncompressed.
     """
+    q = _jpeg_quality(quality)
+    matrix = fitz.Matrix(dpi / 72, dpi / 72)
+
+    src = fitz.open(input_path)
+    out = fitz.open()
     try:
-        q = int(float(quality))
-        if q <= 0:
-            q = 75
-        if q > 100:
-            q = 100
-
-        # Rasterize pages to images then recompress to JPEG and reassemble
-        with tempfile.TemporaryDirectory() as tmpdir:
-            img_dir = os.path.join(tmpdir, 'images')
-            os.makedirs(img_dir, exist_ok=True)
-
-            images = pdf_to_images(input_path, img_dir, dpi=150, format='PNG')
-            if not images:
-                return False
+        if src.page_count == 0:
+            return False
+        for page in src:
+            jpeg = _page_jpeg(page.get_pixmap(matrix=matrix, alpha=False), q)
+            # keep the original page size; the image carries the resolution
+            new_page = out.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, stream=jpeg)
+        out.save(output_path, garbage=1, deflate=True)
+        return True
+    finally:
+        out.close()
+        src.close()
 
-            jpg_paths = []
-            for img_path in images:
-                try:
-                    im = Image.open(img_path).convert('RGB')
-                    jpg_path = os.path.splitext(img_path)[0] + '.jpg'
-                    im.save(jpg_path, 'JPEG', quality=q, optimize=True)
-                    jpg_paths.append(jpg_path)
-                except Exception:
-                    # fallback: keep original PNG if conversion fails
-                    jpg_paths.append(img_path)
-
-            # Assemble into PDF
-            return images_to_pdf(jpg_paths, output_path)
+
+def compress_pdf(input_path, output_path, quality=0.8, mode='optimize'):
+    """Compress a PDF; returns a report dict (bytes saved per stage) or False on failure.
+
+    `mode='optimize'` (default) keeps the document structure and text layer;
+    `mode='rasterize'` renders every page to a JPEG, for scans only.
+    """
+    try:
+        if mode == 'rasterize':
+            if not rasterize_pdf(input_path, output_path, quality):
+                return False
+            original_bytes, output_bytes = os.path.getsize(input_path), os.path.getsize(output_path)
+            return {'original_bytes': original_bytes, 'output_bytes': output_bytes,
+                    'bytes_saved': original_bytes - output_bytes,
+                    'stages': [{'stage': 'rasterize', 'bytes_saved': original_bytes - output_bytes}]}
+        return optimize_pdf(input_path, output_path, quality)
     except Exception as e:
         print(f"Compression error: {e}")
         return False
@@ -191,56 +337,206 @@ def split_pdf(input_path, output_dir, split_type='page', pages_per_file=1, custo
         print(f"Split error: {e}")
         return []
 
-def add_watermark(input_path, output_path, watermark_text, opacity=0.3):
-    """Add a text watermark to a PDF file."""
-    try:
-        reader = PdfReader(input_path)
-        writer = PdfWriter()
+WATERMARK_FONT_SIZE = 40
+WATERMARK_ANGLE = 45  # degrees, rising left to right
 
-        for page in reader.pages:
-            # Create watermark PDF
-            watermark_packet = BytesIO()
-            can = canvas.Canvas(watermark_packet, pagesize=letter)
-            can.setFont("Helvetica", 40)
-            can.setFillColorRGB(0.5, 0.5, 0.5, alpha=opacity)
-            can.saveState()
-            can.translate(300, 300)
-            can.rotate(45)
-            can.drawString(0, 0, watermark_text)
-            can.restoreState()
-            can.save()
-
-            watermark_packet.seek(0)
-            watermark = PdfReader(watermark_packet)
-            watermark_page = watermark.pages[0]
-
-            # Merge watermark with page
-            page.merge_page(watermark_page)
-            writer.add_page(page)
 
-        with open(output_path, 'wb') as f:
-            writer.write(f)
+def _draw_watermark(page, watermark_text, opacity):
+    """Draw the rotated watermark text centred on an empty page."""
+    font = fitz.Font('helv')
+    text_width = font.text_length(watermark_text, fontsize=WATERMARK_FONT_SIZE)
+    rect = page.rect
+    center = rect.tl + (rect.width / 2, rect.height / 2)
+
+    writer = fitz.TextWriter(rect)
+    # baseline placed so the text box (not its origin) sits on the centre
+    origin = center + (-text_width / 2, WATERMARK_FONT_SIZE * 0.35)
+    writer.append(origin, watermark_text, font=font, fontsize=WATERMARK_FONT_SIZE)
+    writer.write_text(page, color=(0.5, 0.5, 0.5), opacity=opacity,
+                      morph=(center, fitz.Matrix(WATERMARK_ANGLE)))
+
+
+def add_watermark(input_path, output_path, watermark_text, opacity=0.3):
+    """Add a text watermark to a PDF file.
+
+    The stamp is drawn once per distinct page size and placed on every page of
+    that size as a shared Form XObject, centred on the visible page.
+    """
+    try:
+        doc = fitz.open(input_path)
+        stamps = fitz.open()
+        try:
+            # all stamps must exist before the first show_pdf_page grafts from them
+            stamp_numbers = {}
+            page_keys = []
+            for page in doc:
+                rect = page.rect
+                key = (round(rect.width, 1), round(rect.height, 1))
+                if key not in stamp_numbers:
+                    stamp = stamps.new_page(width=rect.width, height=rect.height)
+                    _draw_watermark(stamp, watermark_text, opacity)
+                    stamp_numbers[key] = stamp.number
+                page_keys.append(key)
+
+            for page, key in zip(doc, page_keys):
+                # target rect is in unrotated space; turning the stamp with the page keeps it upright
+                page.show_pdf_page(page.rect * page.derotation_matrix, stamps, stamp_numbers[key],
+                                   overlay=True, rotate=page.rotation)
+            doc.save(output_path, garbage=3, deflate=True)
+        finally:
+            stamps.close()
+            doc.close()
 
         return True
     except Exception as e:
         print(f"Watermark error: {e}")
         return False
 
+ZIP_CHUNK_SIZE = 256 * 1024
+
+
+class _TempDirFile(io.FileIO):
+    """Result file that removes its working directory once the response closes it.
+
+    Being a real file, the server can still send it with sendfile.
+    """
+
+    def __init__(self, path, temp_dir):
+        super().__init__(path, 'rb')
+        self._temp_dir = temp_dir
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+
+def iter_zip(paths=(), entries=()):
+    """Yield a ZIP archive of files on disk and (name, bytes) entries, chunk by chunk."""
+    sink = zipstream.ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for path in paths:
+            info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as src, zip_file.open(info, 'w') as dst:
+                for chunk in iter(lambda: src.read(ZIP_CHUNK_SIZE), b''):
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+        for name, data in entries:
+            zip_file.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
+
+
+# Page rendering runs on a process pool; each task opens the document itself.
+# The pool is per gunicorn worker, so by default the CPUs are split across the
+# WEB_CONCURRENCY workers (2, as in the procfile).
+RENDER_PROCESSES = int(os.environ.get(
+    'PDF_RENDER_PROCESSES',
+    max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 2)))))
+RENDER_MAX_WORKERS = min(4, RENDER_PROCESSES)  # concurrent renders per request
+RENDER_CHUNK_PAGES = 4  # pages per task
+RENDER_ERRORS_NAME = 'ERRORS.txt'  # archive entry listing pages that failed to render
+
+_render_pool = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Process pool shared by all requests of this worker, created on first use."""
+    global _render_pool, _render_pool_pid
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            # spawn: forking a threaded server process is not safe
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES,
+                                               mp_context=multiprocessing.get_context('spawn'))
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+
+def _render_page_range(input_path, start, stop, dpi, output):
+    """Render pages [start, stop) to encoded image bytes (runs in a pool process)."""
+    doc = fitz.open(input_path)
+    try:
+        matrix = fitz.Matrix(dpi / 72, dpi / 72)
+        return [doc.load_page(i).get_pixmap(matrix=matrix).tobytes(output) for i in range(start, stop)]
+    finally:
+        doc.close()
+
+
+def _outcome(fn, *args):
+    """Call `fn(*args)`; return (result, None) or (None, exception)."""
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
+
+
+def iter_page_images(input_path, dpi=150, format='PNG', max_workers=RENDER_MAX_WORKERS, skip_errors=False):
+    """Yield (filename, image bytes) for every page of a PDF, in page order.
+
+    Page ranges are rendered in parallel on the process pool with at most
+    `max_workers` ranges in flight, so memory stays bounded by a few ranges.
+    With `skip_errors`, a range that fails to render is logged and left out,
+    and a final RENDER_ERRORS_NAME entry lists the missing pages; otherwise
+    the error is raised.
+    """
+    ext = format.lower()
+    output = 'jpeg' if ext in ('jpg', 'jpeg') else ext
+    doc = fitz.open(input_path)
+    page_count = doc.page_count
+    doc.close()
+
+    ranges = [(start, min(start + RENDER_CHUNK_PAGES, page_count))
+              for start in range(0, page_count, RENDER_CHUNK_PAGES)]
+    if max_workers <= 1 or len(ranges) <= 1:
+        results = (_outcome(_render_page_range, input_path, start, stop, dpi, output) for start, stop in ranges)
+    else:
+        results = _pooled_ranges(input_path, ranges, dpi, output, max_workers)
+
+    failed = []
+    for (start, stop), (images, error) in zip(ranges, results):
+        if error is not None:
+            if not skip_errors:
+                raise error
+            logger.error('Rendering pages %d-%d of %s failed: %s', start + 1, stop, input_path, error)
+            failed.append(f'Pages {start + 1}-{stop}: {error}')
+            continue
+        for page_num, data in enumerate(images, start + 1):
+            yield f'page_{page_num}.{ext}', data
+    if failed:
+        yield RENDER_ERRORS_NAME, ('These pages could not be rendered:\n' + '\n'.join(failed) + '\n').encode()
+
+
+def _pooled_ranges(input_path, ranges, dpi, output, max_workers):
+    pool = get_render_pool()
+    in_flight = deque()
+    try:
+        for start, stop in ranges:
+            in_flight.append(pool.submit(_render_page_range, input_path, start, stop, dpi, output))
+            if len(in_flight) >= max_workers:
+                yield _outcome(in_flight.popleft().result)
+        while in_flight:
+            yield _outcome(in_flight.popleft().result)
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
 def pdf_to_images(input_path, output_dir, dpi=150, format='PNG'):
     """Convert PDF pages to images."""
     try:
-        doc = fitz.open(input_path)
         image_files = []
-
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
-
-            output_file = os.path.join(output_dir, f'page_{page_num+1}.{format.lower()}')
-            pix.save(output_file)
+        for filename, data in iter_page_images(input_path, dpi, format):
+            output_file = os.path.join(output_dir, filename)
+            with open(output_file, 'wb') as f:
+                f.write(data)
             image_files.append(output_file)
-
-        doc.close()
         return image_files
     except Exception as e:
         print(f"PDF to images error: {e}")
@@ -402,8 +698,10 @@ def process_pdfs():
         if not files or files[0].filename == '':
             return jsonify({'error': 'No files selected'}), 400
 
-        # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
+        # Temporary directory for processing; a streamed response removes it once sent
+        temp_dir = tempfile.mkdtemp()
+        keep_temp_dir = False
+        try:
             # Allowed image extensions
             image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
 
@@ -435,6 +733,8 @@ def process_pdfs():
             # Process based on operation
             result_file = None
             result_files = []
+            result_entries = None  # iterable of (name, bytes) for in-memory results
+            result_headers = {}
             extracted_text = None
 
             try:
@@ -478,10 +778,13 @@ def process_pdfs():
                         return jsonify({'error': 'Exactly 1 PDF file required for compression'}), 400
 
                     quality = float(request.form.get('quality', 0.8))
+                    mode = request.form.get('mode', 'optimize')
                     output_file = os.path.join(temp_dir, 'compressed.pdf')
 
-                    if compress_pdf(uploaded_paths[0], output_file, quality):
+                    report = compress_pdf(uploaded_paths[0], output_file, quality, mode)
+                    if report:
                         result_file = output_file
+                        result_headers = {'X-Compression-Report': json.dumps(report)}
 
                 elif operation == 'watermark':
                     if len(uploaded_paths) != 1:
@@ -500,10 +803,18 @@ def process_pdfs():
 
                     dpi = int(request.form.get('dpi', 150))
                     output_format = request.form.get('format', 'PNG')
-                    output_dir = os.path.join(temp_dir, 'images')
-                    os.makedirs(output_dir, exist_ok=True)
 
-                    result_files = pdf_to_images(uploaded_paths[0], output_dir, dpi, output_format)
+                    # rendered pages go straight into the ZIP, never to disk; the first
+                    # page is rendered here so an unreadable or empty PDF fails before
+                    # the streaming response starts, and later failures are listed
+                    # in the archive instead of cutting it short
+                    try:
+                        pages = iter_page_images(uploaded_paths[0], dpi, output_format, skip_errors=True)
+                        first_page = next(pages, None)
+                        if first_page is not None and first_page[0] != RENDER_ERRORS_NAME:
+                            result_entries = chain([first_page], pages)
+                    except Exception as e:
+                        print(f"PDF to images error: {e}")
 
                 # 'extract' operation removed
 
@@ -553,45 +864,42 @@ def process_pdfs():
 
                 # Prepare response
                 # No special JSON response types remain; all successful operations return files/zip
-                if result_files:
-                    # Multiple files result (split, convert)
-                    zip_buffer = BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                        for file_path in result_files:
-                            filename = os.path.basename(file_path)
-                            zip_file.write(file_path, filename)
-
-                    zip_buffer.seek(0)
-
+                if result_files or result_entries is not None:
+                    # Multiple files result (split, convert), zipped while it downloads
                     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                     filename = f"pdf_{operation}_{timestamp}.zip"
 
-                    return send_file(
-                        zip_buffer,
-                        as_attachment=True,
-                        download_name=filename,
-                        mimetype='application/zip'
+                    response = Response(
+                        iter_zip(result_files, result_entries or ()),
+                        mimetype='application/zip',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'}
                     )
+                    response.call_on_close(lambda: shutil.rmtree(temp_dir, ignore_errors=True))
 
                 elif result_file and os.path.exists(result_file):
-                    # Single file result
-                    with open(result_file, 'rb') as f:
-                        file_data = f.read()
-
+                    # Single file result, sent straight from disk
                     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                     filename = f"pdf_{operation}_{timestamp}.pdf"
 
-                    return send_file(
-                        BytesIO(file_data),
+                    response = send_file(
+                        _TempDirFile(result_file, temp_dir),
                         as_attachment=True,
                         download_name=filename,
                         mimetype='application/pdf'
                     )
+                    response.content_length = os.path.getsize(result_file)
+                    response.headers.update(result_headers)
                 else:
                     return jsonify({'error': 'Operation failed'}), 500
 
+                keep_temp_dir = True
+                return response
+
             except Exception as e:
                 return jsonify({'error': f'Processing failed: {str(e)}'}), 500
+        finally:
+            if not keep_temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
 
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
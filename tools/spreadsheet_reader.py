@@ -0,0 +1,112 @@
+"""
+Spreadsheet Reader
+
+Streaming reader for `.xlsx` and `.csv` uploads shared by the employee
+configure endpoints and the ID checker. Rows come back as typed pandas
+DataFrame chunks of bounded size: Excel is read with openpyxl in read-only
+mode (cells are parsed as the sheet is walked) and CSV with chunked pandas
+parsing, so peak memory depends on the chunk size, not the sheet size.
+"""
+
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+DEFAULT_CHUNK_ROWS = 5000
+
+
+def _infer_ext(source, ext):
+    if ext:
+        return ext.lower()
+    name = source if isinstance(source, str) else getattr(source, 'name', '') or ''
+    return os.path.splitext(str(name))[1].lower()
+
+
+def _header_names(row):
+    """Column names from a header row, following pandas' naming of blanks/duplicates."""
+    names, seen = [], {}
+    for i, value in enumerate(row):
+        name = f'Unnamed: {i}' if value is None or str(value).strip() == '' else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def iter_excel_chunks(source, chunk_rows=DEFAULT_CHUNK_ROWS, header=0, skiprows=0):
+    """Yield DataFrame chunks from the first sheet of an `.xlsx` workbook.
+
+    `header=0` takes column names from the first row after `skiprows`;
+    `header=None` numbers the columns 0..n-1 like `pd.read_excel`. Fully
+    blank rows are skipped.
+    """
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        if wb.read_only:
+            # some exporters write a stale <dimension> (e.g. A1:A1) that would cut rows off
+            ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        for _ in range(skiprows):
+            if next(rows, None) is None:
+                return
+
+        columns = None
+        if header is not None:
+            first = next(rows, None)
+            if first is None:
+                return
+            columns = _header_names(first)
+
+        width = len(columns) if columns is not None else 0
+        buffer = []
+        for row in rows:
+            if all(v is None or (isinstance(v, str) and not v.strip()) for v in row):
+                continue
+            buffer.append(row)
+            if columns is None:
+                width = max(width, len(row))
+            if len(buffer) >= chunk_rows:
+                yield _to_frame(buffer, columns, width)
+                buffer = []
+        if buffer:
+            yield _to_frame(buffer, columns, width)
+    finally:
+        wb.close()
+
+
+def _to_frame(rows, columns, width):
+    rows = [tuple(r[:width]) + (None,) * (width - len(r)) for r in rows]
+    return pd.DataFrame.from_records(rows, columns=columns if columns is not None else range(width))
+
+
+def iter_csv_chunks(source, chunk_rows=DEFAULT_CHUNK_ROWS, header=0, skiprows=0, dtype=None):
+    """Yield DataFrame chunks from a CSV file."""
+    yield from pd.read_csv(source, chunksize=chunk_rows, header=header, skiprows=skiprows, dtype=dtype)
+
+
+def iter_chunks(source, ext=None, chunk_rows=DEFAULT_CHUNK_ROWS, header=0, skiprows=0, dtype=None):
+    """Yield DataFrame chunks from an `.xlsx`/`.xls` or `.csv` path or binary file object.
+
+    `dtype` (a column -> type mapping) is applied to CSV parsing and to each
+    Excel chunk, e.g. `{'Employee ID': str}` to keep leading zeros.
+    """
+    ext = _infer_ext(source, ext)
+    if ext == '.csv':
+        yield from iter_csv_chunks(source, chunk_rows, header, skiprows, dtype)
+        return
+    if ext not in ('.xlsx', '.xls', '.xlsm'):
+        raise ValueError(f'Unsupported spreadsheet type: {ext or "unknown"}')
+
+    for chunk in iter_excel_chunks(source, chunk_rows, header, skiprows):
+        if dtype:
+            for col, typ in dtype.items():
+                if col in chunk.columns:
+                    notna = chunk[col].notna()
+                    chunk[col] = chunk[col].astype(object)
+                    chunk.loc[notna, col] = chunk.loc[notna, col].astype(typ)
+        yield chunk
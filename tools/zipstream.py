@@ -0,0 +1,37 @@
+"""
+ZIP Streaming
+
+Helper for writing ZIP archives that can be sent while they are still being
+built, used by the PDF Toolkit's downloads and the ID processor's batch
+output.
+"""
+
+
+class ZipSink:
+    """Write-only target for `zipfile.ZipFile`.
+
+    Without seek/tell, ZipFile writes each entry with a data descriptor
+    instead of seeking back to patch its header, so every byte is final when
+    written. Writes go straight to `raw` when given (e.g. a file that is
+    downloaded while it grows); otherwise they are buffered until `drain()`.
+    """
+
+    def __init__(self, raw=None):
+        self._raw = raw
+        self._chunks = []
+
+    def write(self, data):
+        if self._raw is not None:
+            return self._raw.write(data)
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        if self._raw is not None:
+            self._raw.flush()
+
+    def drain(self):
+        """Return and forget the bytes buffered since the last call."""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data